@@ -1,15 +1,28 @@
 import os
 import functools
+import gzip
+import mimetypes
+import secrets
 import requests
-from flask import Flask, render_template, request, url_for, redirect, flash, session, g, jsonify
+from flask import Flask, Response, abort, render_template, request, url_for, redirect, flash, session, g, jsonify, send_from_directory, stream_with_context
 from forms import BusinessSearchForm, ChangePasswordForm, EditProfileForm, LogForm, MaintenanceForm, SignupForm, LoginForm, images
-from models import db, Location, connect_db, User, Log, Maintenance, Place
+from models import db, connect_db, User, Log, Maintenance, Place, UsersPlaces, StoredImage
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import desc
 from werkzeug.utils import secure_filename
+from itsdangerous import BadData, URLSafeTimedSerializer
 from dotenv import load_dotenv
 from flask_uploads import configure_uploads
-from s3_functions import load_image, upload_file, delete_image
+from s3_functions import UploadTooLarge, MAX_UPLOAD_SIZE, UPLOAD_POLICY_WINDOW
+from storage import get_storage, LocalStorage
+from upload_worker import Staged, read_photo, add_reference, release_images, queue_upload, queue_delete
+from image_variants import VARIANTS, variant_name, srcset
+from sidebar import get_sidebar
+from locations import resolve_location
+from record_pages import load_page
+from yelp_functions import iter_cached_businesses, prefetch_businesses, search_businesses, business_cache_stats, search_cache_stats
+from yelp_client import latency_stats
+from yelp_governor import breaker, quota_status
 
 load_dotenv() #take environmental API_KEY variable from .env
 
@@ -21,20 +34,10 @@ AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_KEY')
 S3_BUCKET = os.environ.get('S3_BUCKET')
 
 CURR_USER_KEY = "curr_user"
-API_BASE_URL = "https://api.yelp.com/v3/businesses"
 UPLOAD_FOLDER = "uploads"
-RATINGS = {
-    "0": "regular_0.png",
-    "1.0": "regular_1.png",
-    "1.5": "regular_1_half.png",
-    "2.0": "regular_2.png",
-    "2.5": "regular_2_half.png",
-    "3.0": "regular_3.png",
-    "3.5": "regular_3_half.png",
-    "4.0": "regular_4.png",
-    "4.5": "regular_4_half.png",
-    "5.0": "regular_5.png"
-    }
+GZIP_MIN_SIZE = 500 # bytes, smaller responses aren't worth compressing
+PLACES_PER_PAGE = 10
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60 # seconds, images are named by their content so never change
 
 
 #
@@ -52,6 +55,12 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = False
 app.config['API_KEY'] = os.environ.get('API_KEY')
 app.config['UPLOADED_IMAGES_DEST'] = UPLOAD_FOLDER
+app.config['STREAM_PLACES'] = os.environ.get('STREAM_PLACES', 'True') == 'True'
+app.config['RECORDS_PER_PAGE'] = int(os.environ.get('RECORDS_PER_PAGE', 50)) # rows on each page of /logs/all and /maintenance/all
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 's3') # or 'local' to keep images on disk
+app.config['S3_BUCKET'] = S3_BUCKET
+app.config['LOCAL_STORAGE_DIR'] = os.environ.get('LOCAL_STORAGE_DIR', 'media')
+app.config['STATUS_TOKEN'] = os.environ.get('STATUS_TOKEN') # bearer token operators send to /status routes, which are hidden while it's unset
 os.environ.setdefault('S3_USE_SIGV4', 'True')
 
 
@@ -59,6 +68,8 @@ connect_db(app)
 
 configure_uploads(app, (images))
 
+photo_keys = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt="photo-key") # signs the names browsers upload photos to
+
 
 ##############################################################################
 # User signup/login/logout
@@ -99,6 +110,112 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
+def storage():
+    """Return the storage backend images are kept in."""
+
+    return get_storage(app.config)
+
+
+def upload_policy():
+    """Return a short-lived policy for the browser to upload a photo straight to storage, under a new random name.
+
+    Its key is signed with the user's id, and is sent back in the form's photo_key once the upload has finished. Returns None if storage can't make one, such as when S3 isn't set up, and photos are sent with the form instead.
+    """
+
+    name = f"incoming-{secrets.token_hex(16)}"
+    try:
+        policy = storage().upload_policy(name, MAX_UPLOAD_SIZE)
+    except storage().errors:
+        return None
+    policy["photo_key"] = photo_keys.dumps({"user": g.user.id, "name": name})
+    return policy
+
+
+app.jinja_env.globals["upload_policy"] = upload_policy
+
+
+def read_staged(form):
+    """Check the photo_key of a photo the browser uploaded itself, and return it as a Staged photo.
+
+    If the key isn't valid or the photo isn't an image, flash a message and return None.
+    """
+
+    try:
+        key = photo_keys.loads(form.photo_key.data, max_age=2 * UPLOAD_POLICY_WINDOW) # the upload can start late in its window
+    except BadData:
+        key = None
+    if not key or key["user"] != g.user.id:
+        flash("Your photo upload expired. Please choose it again.", "danger")
+        return None
+
+    filename = secure_filename(form.photo_name.data or "")
+    extension = os.path.splitext(filename)[1].lower()
+    if not images.extension_allowed(extension[1:]):
+        flash("Only Image Files Allowed.", "danger")
+        return None
+    return Staged(key["name"], extension, mimetypes.guess_type(filename)[0])
+
+
+def read_upload(f, form=None):
+    """Read an uploaded photo, ready to be queued for upload to storage.
+
+    If the browser already uploaded the photo to storage, form's photo_key names it instead of f. If the photo is too large, flash a message and return None.
+    """
+
+    if form is not None and form.photo_key.data:
+        return read_staged(form)
+    try:
+        return read_photo(secure_filename(f.filename), f.stream, f.mimetype)
+    except UploadTooLarge:
+        flash(f"Images must be {MAX_UPLOAD_SIZE // (1024 * 1024)}MB or smaller.", "danger")
+        return None
+
+
+def set_photo(record, photo):
+    """Point record at photo, which stays pending until its upload finishes unless identical bytes are already stored.
+
+    Returns the image_name and image_variants of the image it replaces.
+    """
+
+    previous = (record.image_name, record.image_variants)
+    if isinstance(photo, Staged):
+        record.image_name = photo.filename # until a worker has hashed it
+        record.image_pending = True
+        record.image_variants = False
+        return previous
+
+    stored = add_reference(photo.filename)
+    record.image_name = photo.filename
+    record.image_pending = not stored.uploaded
+    record.image_variants = stored.variants
+    return previous
+
+
+def get_owned_or_abort(model, id):
+    """Return the current user's model record with id, loaded in one query by primary key and owner.
+
+    Aborts with 404 if there is no such record, or 403 if it belongs to another user.
+    """
+
+    record = model.query.filter_by(id=id, user_id=g.user.id).first()
+    if record is None:
+        abort(403 if db.session.query(model.query.filter_by(id=id).exists()).scalar() else 404)
+    return record
+
+
+def image_urls(record):
+    """Return the URL of record's image, and a srcset of its resized variants if it has them."""
+
+    if not record.image_variants:
+        return storage().url(record.image_name), ""
+
+    urls = {variant: storage().url(variant_name(record.image_name, variant)) for variant in VARIANTS}
+    stored = StoredImage.query.get(record.image_name)
+    if stored is None or not stored.variant_widths:
+        return urls["full"], "" # resized before variant widths were recorded, so there's nothing true to put in a srcset
+    return urls["full"], srcset(urls, stored.variant_widths)
+
+
 @app.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
@@ -126,13 +243,11 @@ def signup():
             return render_template("users/signup.html", form=form)
 
         f = request.files['photo']
-        if f:
-            filename = secure_filename(f.filename)
-            f.save(os.path.join(UPLOAD_FOLDER, filename))
-            upload_file(f"uploads/{filename}", S3_BUCKET)
-            os.remove(f"{UPLOAD_FOLDER}/{filename}") # remove file from /uploads, which should be done anyway by Heroku
-            user.image_name=filename
+        photo = read_upload(f) if f else None
+        if photo:
+            set_photo(user, photo)
             db.session.commit()
+            queue_upload(app, storage(), user, photo)
 
         do_login(user)
         return redirect(url_for("home"))
@@ -193,6 +308,38 @@ def home():
     return render_template('home.html', form=form)
 
 
+@app.route("/media/<path:name>")
+def media(name):
+    """Serve an image kept in local storage."""
+
+    local = storage()
+    if not isinstance(local, LocalStorage):
+        abort(404)
+    return send_from_directory(local.root, name, max_age=MEDIA_MAX_AGE)
+
+
+@app.route("/media/upload", methods=["POST"])
+def media_upload():
+    """Accept a photo the browser uploads to local storage, standing in for an S3 presigned POST."""
+
+    local = storage()
+    if not isinstance(local, LocalStorage):
+        abort(404)
+    try:
+        policy = local.check_policy(request.form.get("policy", ""))
+    except BadData:
+        abort(403)
+
+    f = request.files.get("file")
+    if not f or not request.form.get("Content-Type", "").startswith("image/"):
+        abort(400)
+    try:
+        local.put(policy["key"], f.stream, max_size=policy["max_size"])
+    except UploadTooLarge:
+        abort(400)
+    return "", 204
+
+
 @app.route("/users/profile")
 def user_detail():
     """Show a user's credentials, bio, and profile image."""
@@ -200,10 +347,12 @@ def user_detail():
     user = g.user
 
     image = user.image_name
+    image_url = ""
+    image_srcset = ""
+    if image and not user.image_pending:
+        image_url, image_srcset = image_urls(user)
 
-    image_url = load_image(S3_BUCKET, image)
-
-    return render_template("users/detail.html", user=user, url=image_url)
+    return render_template("users/detail.html", user=user, url=image_url, srcset=image_srcset)
 
 
 @app.route("/users/edit", methods=["GET", "POST"])
@@ -217,17 +366,16 @@ def edit_user():
         try: 
             form.populate_obj(user)
             f = request.files['photo']
-            if f:
-                if user.image_name:
-                        profile_image = user.image_name
-                        delete_image(S3_BUCKET, profile_image)
-
-                filename = secure_filename(f.filename)
-                f.save(os.path.join(UPLOAD_FOLDER, f'{filename}'))
-                upload_file(f"uploads/{filename}", S3_BUCKET)
-                os.remove(f"{UPLOAD_FOLDER}/{filename}") # remove file from /uploads, which should be done anyway by Heroku
-                user.image_name=filename
+            photo = None
+            if f or form.photo_key.data:
+                photo = read_upload(f, form)
+                if not photo:
+                    db.session.rollback()
+                    return render_template("users/edit_profile.html", user=user, form=form)
+                previous = set_photo(user, photo)
             db.session.commit()
+            if photo:
+                queue_upload(app, storage(), user, photo, previous)
         
         except IntegrityError:
             flash("Username already taken", "danger")
@@ -284,16 +432,11 @@ def delete_user():
     logs = user.logs
     records = user.maintenance
 
-    for log in logs:
-        delete_image(S3_BUCKET, log.image_name)
-    
-    for record in records:
-        delete_image(S3_BUCKET, record.image_name)
-
-    profile_image = user.image_name
-    delete_image(S3_BUCKET, profile_image)
+    images = [log.image_name for log in logs] + [record.image_name for record in records] + [user.image_name]
+    released = release_images(images)
     db.session.delete(user)
     db.session.commit()
+    queue_delete(storage(), released)
     flash("Account successfully deleted.", "danger")
     return redirect(url_for("signup"))
 
@@ -302,6 +445,19 @@ def delete_user():
 # Yelp API Request Routes
 ######################################################
 
+def gzip_response(response):
+    """Gzip a response body if the browser accepts it and it is worth compressing."""
+
+    if "gzip" not in request.headers.get("Accept-Encoding", "") or response.content_length < GZIP_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+    response.headers["Content-Length"] = response.content_length
+    response.vary.add("Accept-Encoding")
+    return response
+
+
 @app.route("/search", methods=["POST"])
 def submit_search():
     """Return search results from user query."""
@@ -309,13 +465,15 @@ def submit_search():
     data = request.json
     term = data['category']
     location = data['city']
-    params = {'term' : term, 'location' : location}
-    headers = {
-        'Authorization' : (f'Bearer ' + app.config['API_KEY'])}
-    results = requests.get(f"{API_BASE_URL}/search", headers=headers, params=params)
-    resp = results.json()
+    try:
+        resp = search_businesses(app.config['API_KEY'], term, location)
+    except requests.RequestException:
+        return jsonify(error={"code": "SERVICE_UNAVAILABLE", "description": "Search is unavailable right now, please try again shortly."}), 503
 
-    return resp
+    if "businesses" not in resp:
+        return resp # pass Yelp's error on as is
+
+    return gzip_response(jsonify(businesses=[business.to_dict() for business in resp["businesses"]]))
 
 
 @app.route("/places/save", methods=["POST"])
@@ -345,57 +503,76 @@ def save_place():
     return jsonify(message="already saved")
 
 
+def iter_places(place_ids, prefetch_ids=()):
+    """Yield the details of each saved place as soon as its lookup completes.
+
+    Once they are all done, start fetching prefetch_ids in the background so the next page is already cached.
+    """
+
+    for place_id, business in iter_cached_businesses(app.config['API_KEY'], place_ids):
+        if business is None:
+            continue # lookup failed or timed out, show the places that did load
+        yield business
+
+    if prefetch_ids:
+        prefetch_businesses(app, app.config['API_KEY'], prefetch_ids)
+
+
+def stream_template(template_name, **context):
+    """Render a template as a streamed response, sending each part as soon as it is rendered."""
+
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    response = Response(stream_with_context(template.stream(context)))
+    response.headers['X-Accel-Buffering'] = 'no' # keep proxies from holding back the stream
+    return response
+
+
 @app.route("/places", methods=["GET"])
 @login_required
 def show_places():
-    """Show a user's saved places."""
+    """Show a page of a user's saved places, most recently saved first.
 
-    place_ids = [place.id for place in g.user.places]
-    places = []
-    headers = {
-        'Authorization' : (f'Bearer ' + app.config['API_KEY'])}
-        
-    for place_id in place_ids:
-        res = requests.get(f"{API_BASE_URL}/{place_id}", headers=headers)
+    Only the places on this page are looked up, and the next page is prefetched once they have loaded. By default the page is streamed: the page shell is sent straight away, and each place is sent as soon as its Yelp lookup completes.
+    """
 
-        business = res.json()
-    
-        name = business["name"]
-        image_url = business["image_url"]
-        category = (business["categories"])[0]["title"]
-        address_0 = (business["location"])["display_address"][0]
-        address_1 = (business["location"])["display_address"][1]
-        url = business["url"]
-        rating = business["rating"]
-        image = RATINGS[f"{rating}"]
-        path = f"static/images/stars/{image}"
-
-        try:
-            phone = business["phone"]
-        except KeyError:
-            phone = ""
-
-        try:
-            price = business["price"]
-        except KeyError:
-            price = ""
-
-        placeDict = {
-            "place_id" : place_id,
-            "name": name,
-            "image_url" : image_url,
-            "category" : category,
-            "price": price,
-            "phone" : phone,
-            "address_0": address_0,
-            "address_1" : address_1,
-            "url": url,
-            "rating": path
-        }
-
-        places.append(placeDict)
-
-    return render_template('/users/places.html', places=places)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = PLACES_PER_PAGE
+
+    # load this page and the next together, the next page's IDs are prefetched
+    saved = (UsersPlaces.query
+        .filter_by(user_id=g.user.id)
+        .order_by(desc(UsersPlaces.saved_at), UsersPlaces.place_id)
+        .offset((page - 1) * per_page)
+        .limit(per_page * 2)
+        .all())
+    place_ids = [row.place_id for row in saved[:per_page]]
+    next_ids = [row.place_id for row in saved[per_page:]]
+
+    places = iter_places(place_ids, prefetch_ids=next_ids)
+    pages = {"page": page, "prev": page - 1 if page > 1 else None, "next": page + 1 if next_ids else None}
+
+    if app.config['STREAM_PLACES']:
+        return stream_template('users/places.html', places=places, pages=pages)
+
+    return render_template('/users/places.html', places=places, pages=pages)
+
+
+@app.route("/status/yelp")
+def yelp_status():
+    """Show operators the state of this worker's Yelp breaker and caches, and the remaining shared quota."""
+
+    token = app.config['STATUS_TOKEN']
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    if not token or scheme != 'Bearer' or not secrets.compare_digest(supplied.encode(), token.encode()):
+        abort(404)
+
+    return jsonify(
+        breaker=breaker.status(),
+        quota=quota_status(),
+        business_cache=business_cache_stats(),
+        search_cache=search_cache_stats(),
+        latency=latency_stats())
 
 
 @app.route("/places/<id>/delete", methods=["POST"])
@@ -420,31 +597,29 @@ def log_detail(id):
     """Display a full log."""
 
     user = g.user
-    log_ids = [log.id for log in user.logs]
-
-    if id not in log_ids:
-        flash("UNAUTHORIZED.", "danger")
-        return redirect("/logs/new")
+    log = get_owned_or_abort(Log, id)
 
-    logs = Log.query.filter_by(user_id=g.user.id).order_by(desc(Log.date)).limit(5)
-    maintenance = Maintenance.query.filter_by(user_id=user.id).order_by(desc(Maintenance.date)).limit(5)
-    log = Log.query.filter_by(id=id).first()
+    sidebar = get_sidebar(user.id)
     image = log.image_name
     image_url = ""
-    if image:
-        image_url = load_image(S3_BUCKET, image)
+    image_srcset = ""
+    if image and not log.image_pending:
+        image_url, image_srcset = image_urls(log)
 
-    return render_template("users/log.html", user=user, log=log, logs=logs, maintenance=maintenance, url=image_url)
+    return render_template("users/log.html", user=user, log=log, logs=sidebar.logs, maintenance=sidebar.maintenance, url=image_url, srcset=image_srcset)
 
 
 @app.route("/logs/all")
 @login_required
 def all_logs():
-    """Display a list of all of user's logs."""
+    """Display a page of the user's logs, newest first.
 
-    user = g.user
-    logs = user.logs
-    return render_template("users/all_logs.html", logs=logs)
+    Pages are keyed by the date and id of the last log on the page before, passed as ?after=.
+    """
+
+    logs, next_cursor = load_page(Log, g.user.id, request.args.get('after'), app.config['RECORDS_PER_PAGE'])
+    pages = {"first": 'after' in request.args, "next": next_cursor}
+    return render_template("users/all_logs.html", logs=logs, pages=pages)
 
 
 @app.route("/logs/new", methods=["GET", "POST"])
@@ -454,8 +629,7 @@ def new_log():
 
     form = LogForm()
     user = g.user
-    maintenance = Maintenance.query.filter_by(user_id=user.id).order_by(desc(Maintenance.date)).limit(5)
-    logs = Log.query.filter_by(user_id=g.user.id).order_by(desc(Log.date)).limit(5)
+    sidebar = get_sidebar(user.id)
 
     if form.validate_on_submit():
         title = request.form['title']
@@ -465,30 +639,23 @@ def new_log():
         date = request.form['date']
         f = request.files['photo']
 
-        if f:
-            filename = secure_filename(f.filename)
-            f.save(os.path.join(UPLOAD_FOLDER, f'{filename}'))
-            upload_file(f"uploads/{filename}", S3_BUCKET)
-            os.remove(f"{UPLOAD_FOLDER}/{filename}")
-        else:
-            filename = ""
-
-        existing_location = Location.query.filter_by(location=f"{location}").first()
+        photo = None
+        if f or form.photo_key.data:
+            photo = read_upload(f, form)
+            if not photo:
+                return render_template("users/log_form.html", form=form, logs=sidebar.logs, maintenance=sidebar.maintenance)
 
-        if existing_location:
-            log = Log(user_id=user.id, title=title, location_id=existing_location.id, mileage=mileage, text=body,date=date, image_name=filename)
-        else: 
-            new_location = Location(location=location)
-            db.session.add(new_location)
-            db.session.commit()
-            log = Log(user_id=user.id, title=title, location_id=new_location.id, mileage=mileage, text=body,date=date, image_name=filename)
-        
+        log = Log(user_id=user.id, title=title, location_id=resolve_location(location), mileage=mileage, text=body,date=date, image_name="")
+        if photo:
+            set_photo(log, photo)
         db.session.add(log)
         db.session.commit()
+        if photo:
+            queue_upload(app, storage(), log, photo)
 
         return redirect(f"/logs/{log.id}")
 
-    return render_template("users/log_form.html", form=form, logs=logs, maintenance=maintenance)
+    return render_template("users/log_form.html", form=form, logs=sidebar.logs, maintenance=sidebar.maintenance)
 
 
 @app.route("/logs/<int:id>/edit", methods=["GET", "POST"])
@@ -497,28 +664,15 @@ def edit_log(id):
     """Edit a log."""
 
     user = g.user
-    log_ids = [log.id for log in user.logs]
+    log = get_owned_or_abort(Log, id)
 
-    if id not in log_ids:
-        flash("UNAUTHORIZED.", "danger")
-        return redirect("/logs/new")
-
-    logs = Log.query.filter_by(user_id=g.user.id).order_by(desc(Log.date)).limit(5)
-    maintenance = Maintenance.query.filter_by(user_id=user.id).order_by(desc(Maintenance.date)).limit(5)
-    log = Log.query.get_or_404(id)
+    sidebar = get_sidebar(user.id)
     edit_form = LogForm(obj=log)
     edit_form.location.data = log.location.location
 
     if edit_form.validate_on_submit():
         location = request.form['location']
-        existing_location = Location.query.filter_by(location=f"{location}").first()
-        if existing_location:
-            loc_id = existing_location.id
-        else: 
-            new_location = Location(location=location)
-            db.session.add(new_location)
-            db.session.commit()
-            loc_id = new_location.id
+        loc_id = resolve_location(location)
 
         log.title = request.form['title']
         log.mileage = request.form['mileage']
@@ -527,20 +681,21 @@ def edit_log(id):
         log.date = request.form['date']
         f = request.files['photo']
 
-        if f:
-            if log.image_name:
-                delete_image(S3_BUCKET, log.image_name)
-            filename = secure_filename(f.filename)
-            f.save(os.path.join(UPLOAD_FOLDER, f'{filename}'))
-            upload_file(f"uploads/{filename}", S3_BUCKET)
-            os.remove(f"{UPLOAD_FOLDER}/{filename}") # remove file from /uploads, which should be done anyway by Heroku
-            log.image_name=filename
+        photo = None
+        if f or edit_form.photo_key.data:
+            photo = read_upload(f, edit_form)
+            if not photo:
+                db.session.rollback()
+                return render_template('/users/edit_log.html', form=edit_form, logs=sidebar.logs, maintenance=sidebar.maintenance)
+            previous = set_photo(log, photo)
 
         db.session.commit()
+        if photo:
+            queue_upload(app, storage(), log, photo, previous)
 
         return redirect(url_for("log_detail", id=id))
 
-    return render_template('/users/edit_log.html', form=edit_form, logs=logs, maintenance=maintenance)
+    return render_template('/users/edit_log.html', form=edit_form, logs=sidebar.logs, maintenance=sidebar.maintenance)
 
 
 @app.route("/logs/<int:id>/delete/confirm")
@@ -557,16 +712,11 @@ def delete_log_confirm(id):
 def delete_log(id):
     """Delete a log."""
 
-    user = g.user
-    log_ids = [log.id for log in user.logs]
-    if id not in log_ids:
-        flash("UNAUTHORIZED.", "danger")
-        return redirect("/logs/new")
-    log = Log.query.get_or_404(id)
-    if log.image_name:
-        delete_image(S3_BUCKET, log.image_name)
+    log = get_owned_or_abort(Log, id)
+    released = release_images([log.image_name])
     db.session.delete(log)
     db.session.commit()
+    queue_delete(storage(), released)
     return redirect("/logs/new")
 
 
@@ -581,32 +731,30 @@ def maintenance_detail(id):
     """Display a maintenance record."""
 
     user = g.user
-    maintenance_ids = [record.id for record in user.maintenance]
-
-    if id not in maintenance_ids:
-        flash("UNAUTHORIZED.", "danger")
-        return redirect("/maintenance/new")
+    record = get_owned_or_abort(Maintenance, id)
 
-    logs = Log.query.filter_by(user_id=user.id).order_by(desc(Log.date)).limit(5)
-    maintenance = Maintenance.query.filter_by(user_id=user.id).order_by(desc(Maintenance.date)).limit(5)
-    record = Maintenance.query.filter_by(id=id).first()
+    sidebar = get_sidebar(user.id)
     image = record.image_name
     image_url = ""
-    if image:
-            image_url = load_image(S3_BUCKET, image)
+    image_srcset = ""
+    if image and not record.image_pending:
+            image_url, image_srcset = image_urls(record)
     
 
-    return render_template("users/maintenance.html", user=user, record=record, logs=logs, maintenance=maintenance, url=image_url)
+    return render_template("users/maintenance.html", user=user, record=record, logs=sidebar.logs, maintenance=sidebar.maintenance, url=image_url, srcset=image_srcset)
 
 
 @app.route("/maintenance/all")
 @login_required
 def all_maintenance():
-    """Display all maintenance records."""
-    
-    user = g.user
-    maintenance = user.maintenance
-    return render_template("users/all_maintenance.html", maintenance=maintenance)
+    """Display a page of the user's maintenance records, newest first.
+
+    Pages are keyed by the date and id of the last record on the page before, passed as ?after=.
+    """
+
+    maintenance, next_cursor = load_page(Maintenance, g.user.id, request.args.get('after'), app.config['RECORDS_PER_PAGE'])
+    pages = {"first": 'after' in request.args, "next": next_cursor}
+    return render_template("users/all_maintenance.html", maintenance=maintenance, pages=pages)
 
 
 @app.route("/maintenance/new", methods=["GET", "POST"])
@@ -616,8 +764,7 @@ def maintenance_form():
 
     form = MaintenanceForm()
     user = g.user
-    logs = Log.query.filter_by(user_id=g.user.id).order_by(desc(Log.date)).limit(5)
-    records = Maintenance.query.filter_by(user_id=user.id).order_by(desc(Maintenance.date)).limit(5)
+    sidebar = get_sidebar(user.id)
 
     if form.validate_on_submit():
         mileage = request.form['mileage']
@@ -627,30 +774,23 @@ def maintenance_form():
         date = request.form['date']
         f = request.files['photo']
 
-        if f:
-            filename = secure_filename(f.filename)
-            f.save(os.path.join(UPLOAD_FOLDER, f'{filename}'))
-            upload_file(f"uploads/{filename}", S3_BUCKET)
-            os.remove(f"{UPLOAD_FOLDER}/{filename}") # remove file from /uploads, which should be done anyway by Heroku
-        else:
-            filename = ""  
-
-        existing_location = Location.query.filter_by(location=f"{location}").first()
+        photo = None
+        if f or form.photo_key.data:
+            photo = read_upload(f, form)
+            if not photo:
+                return render_template("/users/maintenance_form.html", form=form, logs=sidebar.logs, maintenance=sidebar.maintenance)
 
-        if existing_location:
-            maintenance = Maintenance(user_id=user.id, date=date, mileage=mileage, location_id=existing_location.id, title=title, description=description, image_name=filename)
-        else: 
-            new_location = Location(location=location)
-            db.session.add(new_location)
-            db.session.commit()
-            maintenance = Maintenance(user_id=user.id, date=date, mileage=mileage, location_id=new_location.id, title=title, description=description, image_name=filename)
-        
+        maintenance = Maintenance(user_id=user.id, date=date, mileage=mileage, location_id=resolve_location(location), title=title, description=description, image_name="")
+        if photo:
+            set_photo(maintenance, photo)
         db.session.add(maintenance)
         db.session.commit()
+        if photo:
+            queue_upload(app, storage(), maintenance, photo)
 
         return redirect(f"/maintenance/{maintenance.id}")
 
-    return render_template("/users/maintenance_form.html", form=form, logs=logs, maintenance=records)
+    return render_template("/users/maintenance_form.html", form=form, logs=sidebar.logs, maintenance=sidebar.maintenance)
 
 
 @app.route("/maintenance/<int:id>/edit", methods=["GET", "POST"])
@@ -659,28 +799,15 @@ def edit_maintenance(id):
     """Edit a maintenance record."""
 
     user = g.user
-    maintenance_ids = [record.id for record in user.maintenance]
-
-    if id not in maintenance_ids:
-        flash("UNAUTHORIZED.", "danger")
-        return redirect("/maintenance/new")
+    maintenance = get_owned_or_abort(Maintenance, id)
 
-    logs = Log.query.filter_by(user_id=g.user.id).order_by(desc(Log.date)).limit(5)
-    records = Maintenance.query.filter_by(user_id=user.id).order_by(desc(Maintenance.date)).limit(5)
-    maintenance = Maintenance.query.get_or_404(id)
+    sidebar = get_sidebar(user.id)
     edit_form = MaintenanceForm(obj=maintenance)
     edit_form.location.data = maintenance.location.location
 
     if edit_form.validate_on_submit():
         location = request.form['location']
-        existing_location = Location.query.filter_by(location=f"{location}").first()
-        if existing_location:
-            loc_id = existing_location.id
-        else: 
-            new_location = Location(location=location)
-            db.session.add(new_location)
-            db.session.commit()
-            loc_id = new_location.id
+        loc_id = resolve_location(location)
 
         maintenance.title = request.form['title']
         maintenance.mileage = request.form['mileage']
@@ -689,20 +816,21 @@ def edit_maintenance(id):
         maintenance.date = request.form['date']
         f = request.files['photo']
 
-        if f:
-            if maintenance.image_name:                                
-                delete_image(S3_BUCKET, maintenance.image_name)
-            filename = secure_filename(f.filename)
-            f.save(os.path.join(UPLOAD_FOLDER, f'{filename}'))
-            upload_file(f"uploads/{filename}", S3_BUCKET)
-            os.remove(f"{UPLOAD_FOLDER}/{filename}") # remove file from /uploads, which should be done anyway by Heroku
-            maintenance.image_name=filename
+        photo = None
+        if f or edit_form.photo_key.data:
+            photo = read_upload(f, edit_form)
+            if not photo:
+                db.session.rollback()
+                return render_template('/users/edit_maintenance.html', form=edit_form, logs=sidebar.logs, maintenance=sidebar.maintenance)
+            previous = set_photo(maintenance, photo)
 
         db.session.commit()
+        if photo:
+            queue_upload(app, storage(), maintenance, photo, previous)
 
         return redirect(f"/maintenance/{id}")
 
-    return render_template('/users/edit_maintenance.html', form=edit_form, logs=logs, maintenance=records)
+    return render_template('/users/edit_maintenance.html', form=edit_form, logs=sidebar.logs, maintenance=sidebar.maintenance)
 
 
 @app.route("/maintenance/<int:id>/delete/confirm")
@@ -719,19 +847,12 @@ def delete_maintenance_confirm(id):
 def delete_maintenance(id):
     """Delete a maintenance record."""
 
-    user = g.user
-    maintenance_ids = [record.id for record in user.maintenance]
-
-    if id not in maintenance_ids:
-        flash("UNAUTHORIZED.", "danger")
-        return redirect("/maintenance/new")
-
-    maintenance = Maintenance.query.get_or_404(id)
+    maintenance = get_owned_or_abort(Maintenance, id)
 
-    if maintenance.image_name:
-        delete_image(S3_BUCKET, maintenance.image_name)
+    released = release_images([maintenance.image_name])
     db.session.delete(maintenance)
     db.session.commit()
+    queue_delete(storage(), released)
 
     return redirect("/maintenance/new")
 
@@ -0,0 +1,88 @@
+"""Business record shared by search, saved places and the Yelp caches."""
+
+# correlate yelp rating to the correct star image
+RATINGS = {
+    "0": "regular_0.png",
+    "1.0": "regular_1.png",
+    "1.5": "regular_1_half.png",
+    "2.0": "regular_2.png",
+    "2.5": "regular_2_half.png",
+    "3.0": "regular_3.png",
+    "3.5": "regular_3_half.png",
+    "4.0": "regular_4.png",
+    "4.5": "regular_4_half.png",
+    "5.0": "regular_5.png"
+    }
+
+# built once, so every business with the same rating shares one path string
+STAR_PATHS = {rating: f"static/images/stars/{image}" for rating, image in RATINGS.items()}
+
+
+class Business:
+    """A Yelp business, holding only the fields the app displays.
+
+    rating holds the path of the star image for the business's rating rather than the rating itself.
+    """
+
+    __slots__ = ("place_id", "name", "image_url", "category", "price", "phone", "address_0", "address_1", "url", "rating")
+
+    def __init__(self, place_id, name, image_url, category, price, phone, address_0, address_1, url, rating):
+        self.place_id = place_id
+        self.name = name
+        self.image_url = image_url
+        self.category = category
+        self.price = price
+        self.phone = phone
+        self.address_0 = address_0
+        self.address_1 = address_1
+        self.url = url
+        self.rating = rating
+
+    def __repr__(self):
+        return f"<Business {self.place_id}: {self.name}>"
+
+    def __eq__(self, other):
+        if not isinstance(other, Business):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    @classmethod
+    def from_yelp(cls, data):
+        """Build a business from Yelp's JSON for it.
+
+        Raises KeyError or IndexError if the business is missing details needed to display it.
+        """
+
+        address = data["location"]["display_address"]
+        rating = data["rating"]
+
+        return cls(
+            place_id=data["id"],
+            name=data["name"],
+            image_url=data["image_url"],
+            category=data["categories"][0]["title"],
+            price=data.get("price", ""),
+            phone=data.get("phone", ""),
+            address_0=address[0],
+            address_1=address[1] if len(address) > 1 else "",
+            url=data["url"],
+            rating=STAR_PATHS["0" if not rating else f"{float(rating)}"])
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a business from the output of to_dict."""
+
+        return cls(**data)
+
+    @classmethod
+    def from_cache(cls, data):
+        """Build a business from a shared cache row, which may hold Yelp's JSON if cached before this record existed."""
+
+        if "place_id" in data:
+            return cls.from_dict(data)
+        return cls.from_yelp(data)
+
+    def to_dict(self):
+        """Serialize business for JSON responses and the shared cache."""
+
+        return {field: getattr(self, field) for field in self.__slots__}
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLCache:
+    """In-process least recently used cache whose entries expire.
+
+    Holds at most maxsize entries, evicting the least recently used one when full. Entries older than their time-to-live are treated as missing. Expired entries are kept for a further stale_ttl seconds, for get_stale to fall back on when a fresh value can't be had. Safe to share between threads.
+    """
+
+    def __init__(self, maxsize, ttl, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing or expired."""
+
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None and entry[1] + self.stale_ttl <= now:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_stale(self, key, default=None):
+        """Return the cached value for key even if it has expired, as long as it is within stale_ttl."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] + self.stale_ttl <= time.monotonic():
+                return default
+
+            self.stale_hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Cache value under key for ttl seconds (the cache's ttl by default)."""
+
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the cache's size and hit/miss/eviction counters."""
+
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions
+        }
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single call.
+
+    The first caller for a key runs the function; anyone else asking for the same key while it is running waits for, and shares, its result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return func(), or the result of the call for key already in flight."""
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
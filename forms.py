@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from flask_wtf.recaptcha import validators
-from wtforms import StringField, IntegerField, TextField, TextAreaField, PasswordField
+from wtforms import StringField, IntegerField, TextField, TextAreaField, PasswordField, HiddenField
 from wtforms.validators import InputRequired, ValidationError, DataRequired, Length, email_validator, Email, Optional
 from wtforms.fields.html5 import DateField
 from flask_wtf.file import FileField, FileAllowed
@@ -16,7 +16,17 @@ class BusinessSearchForm(FlaskForm):
     city = StringField("Location", render_kw={'class': 'form-control'}, validators=[InputRequired(message="This field is required.")])
 
 
-class LogForm(FlaskForm):
+class DirectUploadForm(FlaskForm):
+    """Form whose photo the browser can upload straight to storage.
+
+    Its template renders an upload policy into the form. Once the upload finishes, the page's script fills in photo_key and photo_name, and the form is submitted without the file.
+    """
+
+    photo_key = HiddenField()
+    photo_name = HiddenField()
+
+
+class LogForm(DirectUploadForm):
     """Form to submit a new log."""
 
     title = StringField("Title", render_kw={'class': 'form-control', 'placeholder' : 'Title'}, validators=[InputRequired(message="This field is required.")])
@@ -27,7 +37,7 @@ class LogForm(FlaskForm):
     text = TextAreaField("Body", render_kw={'class': 'form-control', 'rows' : '500', 'cols' :'10'}, validators=[InputRequired("This field is required.")])
 
 
-class MaintenanceForm(FlaskForm):
+class MaintenanceForm(DirectUploadForm):
     """Form to submit a new maintenance event."""
 
     title = StringField("Title", render_kw={'class': 'form-control', 'placeholder' : 'Title'}, validators=[InputRequired(message="This field is required.")])
@@ -54,7 +64,7 @@ class LoginForm(FlaskForm):
     password = PasswordField('Password', render_kw={'class': 'form-control'}, validators=[Length(min=6)])
 
 
-class EditProfileForm(FlaskForm):
+class EditProfileForm(DirectUploadForm):
     """Form for editing user profile."""
 
     username = StringField('Username', render_kw={'class': 'form-control'}, validators=[DataRequired()])
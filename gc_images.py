@@ -0,0 +1,115 @@
+"""Delete stored images that nothing references any more.
+
+Uploads that failed halfway, or deletes that never ran, can leave images in storage that no user, log or maintenance record uses. This walks the storage backend and the database side by side, both in name order, so neither has to fit in memory, and deletes the orphans in batches:
+
+    python gc_images.py --dry-run
+    python gc_images.py
+
+Images newer than --min-age seconds are left alone, since they may belong to an upload still in progress.
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from image_variants import VARIANTS, variant_name
+from models import db, User, Log, Maintenance, StoredImage
+from s3_functions import DELETE_BATCH_SIZE
+
+DEFAULT_MIN_AGE = 60 * 60 # seconds
+
+
+def referenced_query():
+    """Select every name in use, an image or one of its variants, in byte order to match storage listings."""
+
+    images = db.union(
+        db.select(User.image_name.label("name")),
+        db.select(Log.image_name),
+        db.select(Maintenance.image_name),
+        db.select(StoredImage.name),
+    ).subquery()
+    suffixes = db.union_all(
+        db.select(db.literal("").label("suffix")),
+        *[db.select(db.literal(variant_name("", variant))) for variant in VARIANTS],
+    ).subquery()
+
+    name = (images.c.name + suffixes.c.suffix).self_group().collate("C").label("name")
+    return (db.select(name)
+        .select_from(images.join(suffixes, db.true()))
+        .where(images.c.name != None, images.c.name != "")
+        .order_by(name))
+
+
+def referenced_names(connection):
+    """Yield the names in use, streamed from a server-side cursor"""
+
+    result = connection.execution_options(stream_results=True).execute(referenced_query())
+    for row in result:
+        yield row.name
+
+
+def find_orphans(stored, referenced):
+    """Yield the (name, modified) pairs of stored that aren't in referenced.
+
+    Both must be sorted by name. Only one name from each is held at a time.
+    """
+
+    referenced = iter(referenced)
+    current = next(referenced, None)
+    for name, modified in stored:
+        while current is not None and current < name:
+            current = next(referenced, None)
+        if current != name:
+            yield name, modified
+
+
+def batches(items, size):
+    """Yield lists of up to size items"""
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def collect(storage, connection, min_age=DEFAULT_MIN_AGE, dry_run=False, report=print):
+    """Delete orphaned images from storage, reporting each one. Returns the counts found, deleted and failed."""
+
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=min_age)
+    orphans = (name for name, modified in find_orphans(storage.list(), referenced_names(connection)) if modified < cutoff)
+    counts = {"found": 0, "deleted": 0, "failed": 0}
+
+    for batch in batches(orphans, DELETE_BATCH_SIZE):
+        counts["found"] += len(batch)
+        for name in batch:
+            report(f"{'would delete' if dry_run else 'deleting'} {name}")
+        if dry_run:
+            continue
+
+        failed = storage.delete_many(batch)
+        for failure in failed:
+            report(f"could not delete {failure['Key']}: {failure['Code']} {failure['Message']}")
+        counts["failed"] += len(failed)
+        counts["deleted"] += len(batch) - len(failed)
+
+    return counts
+
+
+# Main code
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Delete stored images that nothing references.")
+    parser.add_argument("--dry-run", action="store_true", help="report orphaned images without deleting them")
+    parser.add_argument("--min-age", type=int, default=DEFAULT_MIN_AGE, help="only delete images older than this many seconds")
+    args = parser.parse_args()
+
+    from app import app, storage # reads the app's config and connects the database
+
+    with app.app_context(), db.engine.connect() as connection:
+        counts = collect(storage(), connection, min_age=args.min_age, dry_run=args.dry_run)
+
+    if args.dry_run:
+        print(f"{counts['found']} orphaned images found, none deleted (dry run)")
+    else:
+        print(f"{counts['found']} orphaned images found, {counts['deleted']} deleted, {counts['failed']} failed")
@@ -0,0 +1,50 @@
+"""Resized WebP copies of uploaded images, so pages can offer browsers a size to suit the screen."""
+
+import io
+from collections import namedtuple
+from PIL import Image, ImageOps
+
+# variant name: longest side in pixels, largest first so each can be made from the one before
+VARIANTS = {"full": 1600, "medium": 800, "thumb": 320}
+WEBP_QUALITY = 80
+
+Variant = namedtuple("Variant", ["data", "width"]) # WebP bytes, and the width they came out at
+
+
+def variant_name(image, variant):
+    """Return the image name a variant of image is stored under"""
+
+    return f"{image}.{variant}.webp"
+
+
+def make_variants(data):
+    """Resize image data into each variant, returning a dict of Variants by variant name.
+
+    Images are only ever shrunk, so a variant can be narrower than its size. Raises OSError if data isn't an image Pillow can read.
+    """
+
+    variants = {}
+    with Image.open(io.BytesIO(data)) as original:
+        original.draft("RGB", (VARIANTS["full"], VARIANTS["full"])) # lets JPEGs decode straight to a smaller size
+        image = ImageOps.exif_transpose(original) # phones store rotation in EXIF, which the copies would lose
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+        for variant, size in VARIANTS.items():
+            image.thumbnail((size, size), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, "WEBP", quality=WEBP_QUALITY)
+            variants[variant] = Variant(out.getvalue(), image.width)
+
+    return variants
+
+
+def srcset(urls, widths):
+    """Build an img srcset from dicts of URLs and real widths by variant name.
+
+    Variants that came out the same width as a larger one are left out, since a srcset can't list a width twice.
+    """
+
+    candidates = {}
+    for variant in VARIANTS:
+        candidates.setdefault(widths[variant], urls[variant])
+    return ", ".join(f"{url} {width}w" for width, url in candidates.items())
@@ -0,0 +1,79 @@
+"""Resolve the location typed into a log or maintenance form to a locations row, creating it if need be.
+
+Locations are matched ignoring case and runs of whitespace, and stored as first typed, with the whitespace tidied. The row is upserted in the caller's transaction, so concurrent writers adding the same new location can't trip the unique constraint, and no extra commit is needed.
+
+Each worker keeps the ids of recently used locations in a bounded least recently used cache. An id is only cached once the transaction that created it has committed, so a rolled back insert is never handed out.
+"""
+
+import os
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+from cache import TTLCache
+from models import db, Location
+
+LOCATION_CACHE_SIZE = int(os.environ.get('LOCATION_CACHE_SIZE', 10000)) # locations
+LOCATION_CACHE_TTL = int(os.environ.get('LOCATION_CACHE_TTL', 24 * 60 * 60)) # seconds, ids never change so this only bounds memory held by unused entries
+
+# location id by normalized text
+location_cache = TTLCache(maxsize=LOCATION_CACHE_SIZE, ttl=LOCATION_CACHE_TTL)
+
+
+def normalize(text):
+    """Return text with surrounding whitespace stripped and inner runs of whitespace collapsed to one space"""
+
+    return " ".join((text or "").split())
+
+
+def location_key(text):
+    """Return the cache key for location text, matching the lower(location) unique index"""
+
+    return normalize(text).lower()
+
+
+def resolve_location(text):
+    """Return the id of the location matching text, adding it in the current transaction if it is new."""
+
+    location = normalize(text)
+    key = location.lower()
+    location_id = location_cache.get(key)
+    if location_id is not None:
+        return location_id
+
+    stmt = insert(Location).values(location=location)
+    stmt = stmt.on_conflict_do_nothing(index_elements=[db.func.lower(Location.location)]).returning(Location.id)
+    location_id = db.session.execute(stmt).scalar()
+    if location_id is None:
+        # someone else has it, and it's committed now: the insert waits for any transaction still adding it
+        location_id = db.session.execute(
+            db.select(Location.id).where(db.func.lower(Location.location) == key)
+        ).scalar()
+
+    db.session.info.setdefault("resolved_locations", {})[key] = location_id
+    return location_id
+
+
+@event.listens_for(db.session, "after_flush")
+def forget_deleted(db_session, flush_context):
+    for record in db_session.deleted:
+        if isinstance(record, Location):
+            location_cache.delete(location_key(record.location))
+
+
+@event.listens_for(db.session, "after_commit")
+def cache_resolved(db_session):
+    for key, location_id in db_session.info.pop("resolved_locations", {}).items():
+        location_cache.set(key, location_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def forget_resolved(db_session):
+    db_session.info.pop("resolved_locations", None)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+@event.listens_for(db.session, "after_bulk_delete")
+def clear_bulk_writes(context):
+    """Bulk writes don't say which locations they touched, so forget them all"""
+
+    if context.mapper.class_ is Location:
+        location_cache.clear()
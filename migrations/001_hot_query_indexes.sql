@@ -0,0 +1,13 @@
+-- Indexes for the per-user hot queries checked by query_plans.py.
+-- CONCURRENTLY can't run in a transaction, so run this file with plain psql, not --single-transaction.
+
+-- saved_at orders the saved places page. Places saved before it existed count as saved when this runs.
+ALTER TABLE users_places ADD COLUMN IF NOT EXISTS saved_at TIMESTAMP NOT NULL DEFAULT now();
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_logs_user_id_date ON logs (user_id, date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_maintenance_user_id_date ON maintenance (user_id, date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_places_place_id ON users_places (place_id);
+
+-- The saved places page orders by saved_at DESC, place_id, which the old index couldn't serve without a sort.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_places_user_id_saved_at_place_id ON users_places (user_id, saved_at DESC, place_id);
+DROP INDEX CONCURRENTLY IF EXISTS ix_users_places_user_id_saved_at;
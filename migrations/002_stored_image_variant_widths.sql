@@ -0,0 +1,3 @@
+-- The real width of each resized variant, for srcset. Images resized before this get no srcset.
+
+ALTER TABLE stored_images ADD COLUMN IF NOT EXISTS variant_widths JSON;
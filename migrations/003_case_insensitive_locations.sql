@@ -0,0 +1,21 @@
+-- Make locations unique ignoring case, as resolve_location in locations.py expects.
+-- Locations that only differ by case or whitespace are merged into the oldest of them first, or the unique index couldn't be built.
+
+BEGIN;
+
+CREATE TEMP TABLE location_merges ON COMMIT DROP AS
+SELECT id, min(id) OVER (PARTITION BY lower(btrim(regexp_replace(location, '\s+', ' ', 'g')))) AS keep_id
+FROM locations;
+
+UPDATE logs SET location_id = m.keep_id FROM location_merges m WHERE logs.location_id = m.id AND m.id <> m.keep_id;
+UPDATE maintenance SET location_id = m.keep_id FROM location_merges m WHERE maintenance.location_id = m.id AND m.id <> m.keep_id;
+DELETE FROM locations USING location_merges m WHERE locations.id = m.id AND m.id <> m.keep_id;
+
+-- tidied the way resolve_location stores new locations
+UPDATE locations SET location = btrim(regexp_replace(location, '\s+', ' ', 'g'))
+WHERE location <> btrim(regexp_replace(location, '\s+', ' ', 'g'));
+
+ALTER TABLE locations DROP CONSTRAINT IF EXISTS locations_location_key;
+CREATE UNIQUE INDEX IF NOT EXISTS ix_locations_location_lower ON locations (lower(location));
+
+COMMIT;
@@ -0,0 +1,8 @@
+-- The per-user log and maintenance indexes gain id, so pages in (date, id) order are read straight from them.
+-- CONCURRENTLY can't run in a transaction, so run this file with plain psql, not --single-transaction.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_logs_user_id_date_id ON logs (user_id, date, id);
+DROP INDEX CONCURRENTLY IF EXISTS ix_logs_user_id_date;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_maintenance_user_id_date_id ON maintenance (user_id, date, id);
+DROP INDEX CONCURRENTLY IF EXISTS ix_maintenance_user_id_date;
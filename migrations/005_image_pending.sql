@@ -0,0 +1,5 @@
+-- Whether each record's photo is still uploading on the background worker, for databases created before the worker.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS image_pending BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE logs ADD COLUMN IF NOT EXISTS image_pending BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE maintenance ADD COLUMN IF NOT EXISTS image_pending BOOLEAN NOT NULL DEFAULT false;
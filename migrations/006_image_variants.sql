@@ -0,0 +1,5 @@
+-- Whether resized copies were made of each record's photo, for databases created before variants. Older photos get none.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS image_variants BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE logs ADD COLUMN IF NOT EXISTS image_variants BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE maintenance ADD COLUMN IF NOT EXISTS image_variants BOOLEAN NOT NULL DEFAULT false;
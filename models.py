@@ -28,6 +28,8 @@ class User(db.Model):
     password = db.Column(db.Text, nullable=False)
     bio = db.Column(db.Text)
     image_name = db.Column(db.Text, default="default.png")
+    image_pending = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) # still uploading to S3
+    image_variants = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) # resized copies were made
 
     logs = db.relationship("Log", cascade="all, delete", backref="user")
     maintenance = db.relationship("Maintenance", cascade="all, delete", backref="user")
@@ -101,6 +103,10 @@ class Log(db.Model):
     title = db.Column(db.Text, nullable=False, unique=True)
     text = db.Column(db.Text, nullable=False)
     image_name = db.Column(db.Text)
+    image_pending = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) # still uploading to S3
+    image_variants = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) # resized copies were made
+
+    __table_args__ = (db.Index("ix_logs_user_id_date_id", "user_id", "date", "id"),) # a user's logs, newest first, paged by (date, id)
 
 
 class Location(db.Model):
@@ -109,7 +115,9 @@ class Location(db.Model):
     __tablename__ = "locations"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    location = db.Column(db.Text, nullable=False, unique=True)
+    location = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (db.Index("ix_locations_location_lower", db.func.lower(location), unique=True),) # one row per place, however it's capitalized
     
     def __repr__(self):
         return f"<Location #{self.id}: {self.location}>"
@@ -131,6 +139,10 @@ class Maintenance(db.Model):
     title = db.Column(db.Text,nullable=False)
     description = db.Column(db.Text, nullable=False)
     image_name = db.Column(db.Text)
+    image_pending = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) # still uploading to S3
+    image_variants = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) # resized copies were made
+
+    __table_args__ = (db.Index("ix_maintenance_user_id_date_id", "user_id", "date", "id"),) # a user's records, newest first, paged by (date, id)
 
 
 class Place(db.Model):
@@ -153,5 +165,51 @@ class UsersPlaces(db.Model):
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     place_id = db.Column(db.String, db.ForeignKey('places.id'), primary_key=True)
+    saved_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, server_default=db.func.now())
+
+    __table_args__ = (
+        db.Index("ix_users_places_user_id_saved_at_place_id", user_id, saved_at.desc(), place_id), # in the saved places page's order
+        db.Index("ix_users_places_place_id", "place_id"), # the primary key only helps lookups by user
+    )
 
    
+
+
+class CachedBusiness(db.Model):
+    """Cached Yelp business details, shared by every app worker.
+
+    Yelp does not allow its data to be stored for more than 24 hours, so rows are only served, and kept, while they are younger than the business cache TTL. The table is unlogged since it can always be rebuilt from Yelp.
+    """
+
+    __tablename__ = "cached_businesses"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    id = db.Column(db.String, primary_key=True)
+    data = db.Column(db.JSON, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class YelpQuota(db.Model):
+    """Token bucket holding the Yelp calls left in our quota, shared by every app worker."""
+
+    __tablename__ = "yelp_quota"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+
+class StoredImage(db.Model):
+    """An uploaded image in S3, stored under a name made from a hash of its bytes.
+
+    refs counts the users, logs and maintenance records using the image, so identical photos are stored once and only deleted when nothing uses them.
+    """
+
+    __tablename__ = "stored_images"
+
+    name = db.Column(db.Text, primary_key=True)
+    refs = db.Column(db.Integer, nullable=False, default=1)
+    uploaded = db.Column(db.Boolean, nullable=False, default=False)
+    variants = db.Column(db.Boolean, nullable=False, default=False)
+    variant_widths = db.Column(db.JSON) # each variant's width in pixels by variant name, for srcset
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
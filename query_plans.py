@@ -0,0 +1,83 @@
+"""EXPLAIN plans for the queries behind almost every logged-in page.
+
+Print how the configured database plans each hot query, or also run them and show their timings:
+
+    python query_plans.py
+    python query_plans.py --analyze --user-id 42
+
+The tests check each query reads its index in order, so the "recent 5" sidebars and the pages of all logs and records stay index scans however large the tables grow.
+"""
+
+import argparse
+from datetime import date
+from sqlalchemy import desc
+from models import db, Log, Maintenance, UsersPlaces
+from record_pages import page_query
+from sidebar import recent_query
+
+
+def hot_queries(user_id, place_id):
+    """Return the hot queries for a user and place by name, each with the index it should be served from"""
+
+    return {
+        "recent_logs": (recent_query(Log, user_id), "ix_logs_user_id_date_id"),
+        "recent_maintenance": (recent_query(Maintenance, user_id), "ix_maintenance_user_id_date_id"),
+        "log_page": (page_query(Log, user_id, after=(date.max, 0)), "ix_logs_user_id_date_id"),
+        "maintenance_page": (page_query(Maintenance, user_id, after=(date.max, 0)), "ix_maintenance_user_id_date_id"),
+        "saved_places": (UsersPlaces.query.filter_by(user_id=user_id).order_by(desc(UsersPlaces.saved_at), UsersPlaces.place_id).limit(20), "ix_users_places_user_id_saved_at_place_id"),
+        "place_savers": (UsersPlaces.query.filter_by(place_id=place_id), "ix_users_places_place_id"),
+    }
+
+
+def explain(query, analyze=False, format="json"):
+    """Return Postgres's plan for query (an ORM query or a select), as a dict for format="json" or as lines of text for format="text".
+
+    With analyze the query is run too, adding actual row counts and timings.
+    """
+
+    statement = getattr(query, "statement", query)
+    compiled = statement.compile(dialect=db.engine.dialect)
+    options = f"{'ANALYZE, BUFFERS, ' if analyze else ''}FORMAT {format.upper()}"
+    result = db.session.connection().exec_driver_sql(f"EXPLAIN ({options}) {compiled}", compiled.params)
+    if format == "json":
+        return result.scalar()[0]["Plan"]
+    return [row[0] for row in result]
+
+
+def plan_nodes(plan):
+    """Yield every node of a JSON plan, depth first"""
+
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def busiest_user():
+    """Return the id of the user with the most logs, whose queries have the most rows to get through"""
+
+    return (db.session.query(Log.user_id)
+        .group_by(Log.user_id)
+        .order_by(desc(db.func.count()))
+        .limit(1)
+        .scalar())
+
+
+# Main code
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show how the database plans the app's hot queries.")
+    parser.add_argument("--analyze", action="store_true", help="run each query and show actual rows and timings")
+    parser.add_argument("--user-id", type=int, help="defaults to the user with the most logs")
+    parser.add_argument("--place-id", default="", help="defaults to a place that user saved")
+    args = parser.parse_args()
+
+    from app import app # reads the app's config and connects the database
+
+    with app.app_context():
+        user_id = args.user_id or busiest_user()
+        place_id = args.place_id or db.session.query(UsersPlaces.place_id).filter_by(user_id=user_id).limit(1).scalar() or ""
+        for name, (query, index) in hot_queries(user_id, place_id).items():
+            print(f"{name} (should use {index}):")
+            for line in explain(query, analyze=args.analyze, format="text"):
+                print(f"  {line}")
+            print()
+        db.session.rollback()
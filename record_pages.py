@@ -0,0 +1,49 @@
+"""Keyset pagination of a user's logs or maintenance records, newest first.
+
+A page starts after the (date, id) of the last record on the page before, rather than at an offset, so the database reads the user's date index from that point and every page costs the same however far back it is. Pages only load the columns the list shows, with each record's location joined in, so long log text and descriptions are never read.
+"""
+
+from datetime import date
+from sqlalchemy import desc, tuple_
+from sqlalchemy.orm import joinedload, load_only
+
+DEFAULT_PER_PAGE = 50
+
+
+def encode_cursor(record):
+    """Return the cursor for the page after record"""
+
+    return f"{record.date.isoformat()}_{record.id}"
+
+
+def decode_cursor(cursor):
+    """Return the (date, id) a cursor points after, or None if it is missing or malformed"""
+
+    try:
+        day, id = cursor.split("_")
+        return date.fromisoformat(day), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def page_query(model, user_id, after=None, per_page=DEFAULT_PER_PAGE):
+    """Select a page of a user's Log or Maintenance records, newest first, starting after the (date, id) key after.
+
+    Fetches one record more than per_page, to tell whether there is a next page.
+    """
+
+    query = (model.query
+        .options(load_only(model.id, model.title, model.date), joinedload(model.location))
+        .filter(model.user_id == user_id))
+    if after is not None:
+        query = query.filter(tuple_(model.date, model.id) < after)
+    return query.order_by(desc(model.date), desc(model.id)).limit(per_page + 1)
+
+
+def load_page(model, user_id, cursor=None, per_page=DEFAULT_PER_PAGE):
+    """Return a page of a user's records, and the cursor for the next page or None if this is the last."""
+
+    records = page_query(model, user_id, decode_cursor(cursor), per_page).all()
+    if len(records) > per_page:
+        return records[:per_page], encode_cursor(records[per_page - 1])
+    return records, None
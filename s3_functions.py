@@ -1,54 +1,258 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from urllib.parse import quote, urlsplit
 import boto3 # AWS SDK for python
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
+from cache import TTLCache
+
+S3_REGION = os.environ.get('S3_REGION', 'us-east-2')
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 20)) # kept-alive connections to S3 per worker
+S3_MAX_ATTEMPTS = int(os.environ.get('S3_MAX_ATTEMPTS', 5)) # including the first attempt
+URL_WINDOW = int(os.environ.get('S3_URL_WINDOW', 60 * 60)) # seconds, image URLs are reused for the rest of the window they were made in
+URL_CACHE_SIZE = int(os.environ.get('S3_URL_CACHE_SIZE', 1000))
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 20 * 1024 * 1024)) # bytes
+UPLOAD_PART_SIZE = 8 * 1024 * 1024 # bytes, S3 parts must be at least 5MB
+DELETE_BATCH_SIZE = 1000 # most keys S3 will delete in one request
+UPLOAD_POLICY_WINDOW = int(os.environ.get('UPLOAD_POLICY_WINDOW', 60 * 60)) # seconds a browser has to start a direct upload
+
+# larger uploads are sent as a multipart upload, holding only a few parts in memory at once
+transfer_config = TransferConfig(multipart_threshold=UPLOAD_PART_SIZE, multipart_chunksize=UPLOAD_PART_SIZE, max_concurrency=2)
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload is bigger than its size limit."""
+
+
+def make_config():
+    """Build the S3 client config, with a sized connection pool and adaptive retries"""
+
+    options = dict(
+        region_name = S3_REGION,
+        signature_version = 's3v4',
+        max_pool_connections = S3_MAX_POOL_CONNECTIONS,
+        retries = {'mode': 'adaptive', 'max_attempts': S3_MAX_ATTEMPTS}
+    )
+    if 'tcp_keepalive' in Config.OPTION_DEFAULTS: # only known to newer botocore releases
+        options['tcp_keepalive'] = True
+    return Config(**options)
+
+
+my_config = make_config()
+
+# One client per process, created on first use. Clients are thread safe but shouldn't be shared across a fork,
+# so a gunicorn worker forked after the client was made builds its own.
+s3 = {"client": None, "session": None, "lock": threading.Lock()}
+
+
+def get_client():
+    """Return this process's S3 client, creating it if needed"""
+
+    client = s3["client"]
+    if client is not None:
+        return client
+
+    with s3["lock"]:
+        if s3["client"] is None:
+            s3["session"] = boto3.session.Session()
+            s3["client"] = s3["session"].client('s3', config=my_config)
+        return s3["client"]
+
+
+def get_credentials():
+    """Return the current access key, secret key and session token of this process's S3 client"""
+
+    get_client()
+    return s3["session"].get_credentials().get_frozen_credentials()
+
+
+def reset_client():
+    """Forget the S3 client, so the next call creates a new one"""
+
+    s3["client"] = None
+    s3["session"] = None
+    s3["lock"] = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_client)
 
-my_config = Config(
-    region_name = 'us-east-2',
-    signature_version = 's3v4'
-)
 
 def upload_file(file_name, bucket):
-    """Upload file to S3 bucket""""
+    """Upload file to S3 bucket"""
 
     object_name = file_name
 
-    s3_client = boto3.client('s3', config=my_config)
-
-    response = s3_client.upload_file(file_name, bucket, object_name)
+    response = get_client().upload_file(file_name, bucket, object_name)
+    url_cache.delete((bucket, object_name)) # a new URL, so browsers don't show a cached copy of the old image
     return response
 
 
+class HashingReader:
+    """Read-only view of a file that hashes and counts the bytes read from it, failing once too many have been.
+
+    Only read is exposed, so boto3 treats it as a stream and reads it once from start to end.
+    """
+
+    def __init__(self, fileobj, max_size):
+        self.fileobj = fileobj
+        self.max_size = max_size
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLarge(f"Upload is larger than {self.max_size} bytes.")
+        self.sha256.update(data)
+        return data
+
+
+def upload_stream(fileobj, bucket, key, content_type=None, max_size=MAX_UPLOAD_SIZE):
+    """Stream a file object to S3 bucket without saving it to disk first.
+
+    Returns the upload's size and SHA-256 hex digest, worked out as it is sent. Raises UploadTooLarge, leaving nothing in the bucket, if fileobj holds more than max_size bytes.
+    """
+
+    reader = HashingReader(fileobj, max_size)
+    extra_args = {'ContentType': content_type} if content_type else None
+
+    get_client().upload_fileobj(reader, bucket, key, ExtraArgs=extra_args, Config=transfer_config)
+    url_cache.delete((bucket, key)) # a new URL, so browsers don't show a cached copy of the old image
+    return {"size": reader.size, "sha256": reader.sha256.hexdigest()}
+
+
+def presign_upload(bucket, key, max_size=MAX_UPLOAD_SIZE, expires_in=UPLOAD_POLICY_WINDOW):
+    """Return the URL and form fields for a browser to POST an image straight to key in S3 bucket.
+
+    The policy only accepts image content types up to max_size bytes, and expires after expires_in seconds.
+    """
+
+    conditions = [["content-length-range", 1, max_size], ["starts-with", "$Content-Type", "image/"]]
+    return get_client().generate_presigned_post(bucket, key, Conditions=conditions, ExpiresIn=expires_in)
+
+
+def download_bytes(bucket, key, max_size=MAX_UPLOAD_SIZE):
+    """Return the contents of key in S3 bucket, raising UploadTooLarge if it is over max_size bytes."""
+
+    body = get_client().get_object(Bucket=bucket, Key=key)['Body']
+    try:
+        data = body.read(max_size + 1)
+    finally:
+        body.close()
+    if len(data) > max_size:
+        raise UploadTooLarge(f"Upload is larger than {max_size} bytes.")
+    return data
+
+
+def iter_files(bucket, prefix=""):
+    """Yield every item in S3 bucket whose key starts with prefix, in key order.
+
+    Items are fetched a page of up to 1000 at a time as they are needed, so any number of keys can be listed in bounded memory.
+    """
+
+    paginator = get_client().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        yield from page.get('Contents', [])
+
+
 def list_files(bucket):
     """List all items in S3 bucket"""
 
-    s3_client = boto3.client('s3', config=my_config)
+    return list(iter_files(bucket))
 
-    contents = []
-    try:
-        for item in s3_client.list_objects(Bucket=bucket)['Contents']:
-            contents.append(item)
-    except Exception as e:
-        pass
-    return contents
+
+# presigned image URLs by (bucket, key), kept until the end of the window they were made in
+url_cache = TTLCache(maxsize=URL_CACHE_SIZE, ttl=URL_WINDOW)
+
+
+def presign_get(credentials, host, key, signed_at, expires_in, params=None, region=S3_REGION):
+    """Return a URL for GETting key from host, signed with AWS Signature Version 4 as if at signed_at, in seconds since the epoch.
+
+    botocore always signs at the current time, so URLs it presigns differ from second to second. Signing here lets every process sign the same URL for the same time.
+    """
+
+    amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(signed_at))
+    scope = f"{amz_date[:8]}/{region}/s3/aws4_request"
+    query = dict(params or {}, **{
+        "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+        "X-Amz-Credential": f"{credentials.access_key}/{scope}",
+        "X-Amz-Date": amz_date,
+        "X-Amz-Expires": str(expires_in),
+        "X-Amz-SignedHeaders": "host",
+    })
+    if credentials.token:
+        query["X-Amz-Security-Token"] = credentials.token
+    query_string = "&".join(f"{quote(name, safe='')}={quote(value, safe='')}" for name, value in sorted(query.items()))
+
+    path = quote(f"/{key}")
+    canonical_request = f"GET\n{path}\n{query_string}\nhost:{host}\n\nhost\nUNSIGNED-PAYLOAD"
+    string_to_sign = f"AWS4-HMAC-SHA256\n{amz_date}\n{scope}\n{hashlib.sha256(canonical_request.encode()).hexdigest()}"
+
+    signing_key = f"AWS4{credentials.secret_key}".encode()
+    for part in (amz_date[:8], region, "s3", "aws4_request"):
+        signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    return f"https://{host}{path}?{query_string}&X-Amz-Signature={signature}"
 
 
 def load_image(bucket, image):
-    """Generate url for an item in the S3 bucket"""
+    """Generate url for an item in the S3 bucket.
+
+    URLs are signed as of the start of the current URL_WINDOW, so every page view in a window, from any worker, gets the same URL and the browser can cache the image. Each URL stays valid, and tells the browser to cache the image, for two windows from that start, so a page rendered late in a window doesn't show broken images.
+    """
 
-    s3_client = boto3.client('s3', config=my_config)
+    key = f'uploads/{image}'
+    response = url_cache.get((bucket, key))
+    if response is not None:
+        return response
 
-    response = s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': f'uploads/{image}'}, ExpiresIn=100)
+    now = time.time()
+    window_start = int(now // URL_WINDOW * URL_WINDOW)
+    expires_in = 2 * URL_WINDOW
 
+    host = f"{bucket}.{urlsplit(get_client().meta.endpoint_url).netloc}"
+    response = presign_get(get_credentials(), host, key, window_start, expires_in,
+        params={'response-cache-control': f'private, max-age={expires_in}'})
+
+    url_cache.set((bucket, key), response, ttl=window_start + URL_WINDOW - now)
     return response
 
 
 def delete_image(bucket, image):
     """Delete an image in the S3 bucket"""
 
-    s3_client = boto3.client('s3', config=my_config)
-
-    response = s3_client.delete_object(
+    response = get_client().delete_object(
         Bucket=bucket,
         Key=f'uploads/{image}'
     )
+    url_cache.delete((bucket, f'uploads/{image}'))
+
+    return response
+
+
+def delete_images(bucket, images):
+    """Delete many images in the S3 bucket, up to DELETE_BATCH_SIZE per request.
+
+    Empty and repeated image names are skipped. Returns a list of {"Key", "Code", "Message"} dicts for the images S3 failed to delete; an empty list means every image was deleted.
+    """
+
+    keys = list(dict.fromkeys(f'uploads/{image}' for image in images if image))
+    failed = []
+
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        response = get_client().delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+        )
+        failed.extend({"Key": error["Key"], "Code": error.get("Code"), "Message": error.get("Message")} for error in response.get('Errors', []))
+
+        for key in batch:
+            url_cache.delete((bucket, key))
 
-    return response
\ No newline at end of file
+    return failed
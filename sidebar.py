@@ -0,0 +1,95 @@
+"""Recent logs and maintenance records for the sidebars of the log and maintenance pages.
+
+Both lists are fetched with their locations in one query, and cached per user. Any write to a user's logs or maintenance records invalidates their sidebar: this worker's copy is dropped when the write commits, and a version number in the user's session makes every other worker refetch on the user's next request. The user's other sessions may see a stale sidebar for up to SIDEBAR_TTL.
+"""
+
+import os
+from collections import namedtuple
+from flask import has_request_context, session
+from sqlalchemy import desc, event
+from cache import TTLCache
+from models import db, User, Log, Maintenance, Location
+
+SIDEBAR_SIZE = 5 # entries in each list
+SIDEBAR_TTL = int(os.environ.get('SIDEBAR_TTL', 5 * 60)) # seconds
+SIDEBAR_CACHE_SIZE = int(os.environ.get('SIDEBAR_CACHE_SIZE', 10000)) # users
+VERSION_KEY = "sidebar_version"
+USER_KEY = "curr_user" # app.CURR_USER_KEY, the logged in user's id in the session
+
+Entry = namedtuple("Entry", ["id", "title", "location", "date"])
+Sidebar = namedtuple("Sidebar", ["logs", "maintenance"])
+
+# (session version, Sidebar) by user id
+sidebar_cache = TTLCache(maxsize=SIDEBAR_CACHE_SIZE, ttl=SIDEBAR_TTL)
+
+
+def recent_query(model, user_id, limit=SIDEBAR_SIZE):
+    """Select a user's latest Log or Maintenance rows with their locations, newest first"""
+
+    return (db.select(db.literal(model.__tablename__).label("kind"), model.id, model.title, Location.location, model.date)
+        .select_from(model)
+        .outerjoin(Location, model.location_id == Location.id)
+        .where(model.user_id == user_id)
+        .order_by(desc(model.date), desc(model.id))
+        .limit(limit))
+
+
+def fetch_sidebar(user_id):
+    """Load a user's sidebar from the database in one round trip"""
+
+    rows = db.session.execute(db.union_all(recent_query(Log, user_id), recent_query(Maintenance, user_id))).all()
+    lists = {Log.__tablename__: [], Maintenance.__tablename__: []}
+    for row in sorted(rows, key=lambda row: (row.date, row.id), reverse=True):
+        lists[row.kind].append(Entry(row.id, row.title, row.location, row.date))
+    return Sidebar(lists[Log.__tablename__], lists[Maintenance.__tablename__])
+
+
+def get_sidebar(user_id):
+    """Return the logged in user's sidebar, from the cache if it is up to date"""
+
+    version = session.get(VERSION_KEY, 0)
+    cached = sidebar_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    sidebar = fetch_sidebar(user_id)
+    sidebar_cache.set(user_id, (version, sidebar))
+    return sidebar
+
+
+def invalidate(user_id):
+    """Drop a user's cached sidebar, here and, through their session, in every other worker"""
+
+    sidebar_cache.delete(user_id)
+    # runs after commit, when ORM objects like g.user are expired and can't be loaded, so go by the session's user id
+    if has_request_context() and session.get(USER_KEY) == user_id:
+        session[VERSION_KEY] = session.get(VERSION_KEY, 0) + 1
+
+
+@event.listens_for(db.session, "after_flush")
+def collect_writes(db_session, flush_context):
+    """Note the users whose logs or maintenance records were written, to invalidate once the transaction commits"""
+
+    for record in set(db_session.new) | set(db_session.dirty) | set(db_session.deleted):
+        if isinstance(record, (Log, Maintenance)) and record.user_id is not None:
+            db_session.info.setdefault("sidebar_users", set()).add(record.user_id)
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_writes(db_session):
+    for user_id in db_session.info.pop("sidebar_users", ()):
+        invalidate(user_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def forget_writes(db_session):
+    db_session.info.pop("sidebar_users", None)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+@event.listens_for(db.session, "after_bulk_delete")
+def invalidate_bulk_writes(context):
+    """Bulk writes don't say whose rows they touched, so drop every cached sidebar"""
+
+    if context.mapper.class_ in (User, Log, Maintenance, Location):
+        sidebar_cache.clear()
@@ -1,17 +1,3 @@
-// object to correlate yelp rating to the correct star image
-const RATINGS = {
-    "0": "regular_0.png",
-    "1": "regular_1.png",
-    "1.5": "regular_1_half.png",
-    "2": "regular_2.png",
-    "2.5": "regular_2_half.png",
-    "3": "regular_3.png",
-    "3.5": "regular_3_half.png",
-    "4": "regular_4.png",
-    "4.5": "regular_4_half.png",
-    "5": "regular_5.png"
-}
-
 /*
 * svg file loading spinner functions
 */
@@ -57,6 +43,8 @@ async function processForm(evt) {
 /**
  * If on the logged out landing page, remove the jumbotron to free up screen space for the results
  * Take the result and appened to the results div
+ * 
+ * The server only sends the fields shown here, with the path to the star rating image already worked out
  */
 function handleResponse(businesses) {
 
@@ -66,14 +54,12 @@ function handleResponse(businesses) {
 
     for (const business of businesses) {
 
-        const rating = business.rating;
-
-        const image_path = `static/images/stars/${RATINGS[rating]}`;
+        const image_path = business.rating;
 
         let priceDisplay = "";
         let phoneDisplay = "";
 
-        if (business.price == undefined) {
+        if (!business.price) {
             priceDisplay = "display: none;"
         }
 
@@ -91,13 +77,13 @@ function handleResponse(businesses) {
         <p class="fw-bold" style="font-size: 1.2rem; color: #05386B;">${business.name}</p>
         <p class="info"><img class="mb-2" src="${image_path}"></p>
         <p class="info d-none d-md-inline m-2 fw-bold">Category: <span
-                class="fw-normal">${business.categories[0]["title"]}</span></p>
+                class="fw-normal">${business.category}</span></p>
         <p class="info fw-bold" style="${priceDisplay}">Price: <span class="fw-normal">${business.price}</span></p>
         </div>
 
         <div class="col-6 col-md-3 text-center">
-        <p class=" mt-3 address">${business.location.display_address[0]}</p>
-        <p class="address">${business.location.display_address[1]}</p>
+        <p class=" mt-3 address">${business.address_0}</p>
+        <p class="address">${business.address_1}</p>
         <p class="info mt-2 fw-bold" style="${phoneDisplay}">Phone: <span class="fw-normal">${business.phone}</span>
         </p>
         <a href=${business.url} class="d-none d-md-inline url"><img class="m-3" src="static/images/yelp_logo.png"
@@ -105,7 +91,7 @@ function handleResponse(businesses) {
         </div>
         <div class="col-12 col-md-2 align-self-center text-center">
         <form class="save-form">
-        <input type="hidden" id="place-id" name="placeId" value="${business.id}">
+        <input type="hidden" id="place-id" name="placeId" value="${business.place_id}">
         <button type="submit" class="save-button btn-warning btn-lg">Save!</button>
         </form>
         <a href=${business.url} class="d-md-none url"><img class="m-3" src="static/images/yelp_logo.png"
@@ -166,6 +152,53 @@ async function removePlace(evt) {
 }
 
 
+/**
+ * Upload a form's photo straight to storage, using the short-lived policy rendered into the form
+ * Only the signed key and the photo's file name are then submitted with the form, so the app doesn't wait on the transfer
+ * If the upload fails, the form is submitted with the photo as before
+ */
+async function uploadPhoto(evt) {
+
+    const form = this;
+    const input = $('input[type=file][name=photo]', form)[0];
+    const submitter = evt.originalEvent && evt.originalEvent.submitter;
+
+    // nothing to upload, already uploaded, or a button that doesn't save the form
+    if (!input || !input.files.length || form.dataset.uploaded || (submitter && submitter.getAttribute('formmethod') == 'GET')) {
+        return;
+    }
+
+    evt.preventDefault();
+    form.dataset.uploaded = 'true';
+
+    const file = input.files[0];
+    const policy = JSON.parse(form.dataset.uploadPolicy);
+    const data = new FormData();
+    for (const [name, value] of Object.entries(policy.fields)) {
+        data.append(name, value);
+    }
+    data.append('Content-Type', file.type);
+    data.append('file', file); // S3 ignores any fields after the file
+
+    try {
+        const res = await fetch(policy.url, { method: 'POST', body: data });
+        if (res.ok) {
+            $('input[name=photo_key]', form).val(policy.photo_key);
+            $('input[name=photo_name]', form).val(file.name);
+            input.value = '';
+        }
+    } catch (err) {
+        // network or CORS error, so send the photo with the form instead
+    }
+
+    if (form.requestSubmit) {
+        form.requestSubmit(submitter);
+    } else {
+        form.submit();
+    }
+}
+
+
 /**
  * Event handlers for submitting search form, and saving and removing places
  * the loading spinner is activated anytime a form is submitted
@@ -173,6 +206,7 @@ async function removePlace(evt) {
 $("#search-form").on("submit", processForm);
 $("body").on("click", ".save-button", savePlace);
 $(".remove-button").on("click", removePlace);
+$("form[data-upload-policy]").on("submit", uploadPhoto);
 $("form").on("submit", showSpinner);
 $(document).ready(hideSpinner);
 
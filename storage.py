@@ -0,0 +1,179 @@
+"""Storage backends for uploaded images.
+
+Both backends store images by name and offer the same methods: put, get, url, upload_policy, delete, delete_many and list. The backend is chosen by app.config['STORAGE_BACKEND']:
+
+- "s3" keeps images in the S3_BUCKET bucket, under uploads/.
+- "local" keeps them in the LOCAL_STORAGE_DIR directory, served by the app's /media route, so uploads can be developed, tested and load tested without AWS. Browsers upload to it through /media/upload, which stands in for S3's presigned POSTs.
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import BotoCoreError, ClientError
+from itsdangerous import URLSafeTimedSerializer
+from s3_functions import HashingReader, UploadTooLarge, MAX_UPLOAD_SIZE, UPLOAD_POLICY_WINDOW, upload_stream, download_bytes, presign_upload, load_image, delete_image, delete_images, iter_files
+
+COPY_CHUNK_SIZE = 1024 * 1024 # bytes
+
+
+class S3Storage:
+    """Images kept in an S3 bucket."""
+
+    errors = (BotoCoreError, ClientError, S3UploadFailedError) # raised when S3 can't be reached or refuses a call
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def put(self, name, fileobj, content_type=None, max_size=MAX_UPLOAD_SIZE):
+        """Store fileobj as name. Returns its size and SHA-256, and raises UploadTooLarge past max_size bytes."""
+
+        return upload_stream(fileobj, self.bucket, f"uploads/{name}", content_type=content_type, max_size=max_size)
+
+    def get(self, name, max_size=MAX_UPLOAD_SIZE):
+        """Return the bytes stored as name, raising UploadTooLarge past max_size bytes."""
+
+        return download_bytes(self.bucket, f"uploads/{name}", max_size=max_size)
+
+    def url(self, name):
+        """Return a URL the browser can load name from."""
+
+        return load_image(self.bucket, name)
+
+    def upload_policy(self, name, max_size=MAX_UPLOAD_SIZE):
+        """Return the URL and form fields for a browser to upload an image straight to name."""
+
+        return presign_upload(self.bucket, f"uploads/{name}", max_size=max_size)
+
+    def delete(self, name):
+        """Delete name."""
+
+        delete_image(self.bucket, name)
+
+    def delete_many(self, names):
+        """Delete names, returning a {"Key", "Code", "Message"} dict for each that couldn't be."""
+
+        return delete_images(self.bucket, names)
+
+    def list(self):
+        """Yield the (name, last modified) of each stored image, in name order, a page at a time."""
+
+        for item in iter_files(self.bucket, prefix="uploads/"):
+            yield item["Key"][len("uploads/"):], item["LastModified"]
+
+
+class LocalStorage:
+    """Images kept in a directory on local disk."""
+
+    errors = (OSError,)
+
+    def __init__(self, root, url_prefix="/media", secret_key=None):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix
+        self.policies = URLSafeTimedSerializer(secret_key or os.urandom(32), salt="local-upload")
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, name):
+        """Return the path name is stored at, refusing names that would escape the storage directory."""
+
+        path = os.path.abspath(os.path.join(self.root, name))
+        if os.path.dirname(path) != self.root:
+            raise ValueError(f"Invalid image name: {name!r}")
+        return path
+
+    def put(self, name, fileobj, content_type=None, max_size=MAX_UPLOAD_SIZE):
+        """Store fileobj as name. Returns its size and SHA-256, and raises UploadTooLarge past max_size bytes.
+
+        The file is written under a temporary name and then renamed, so a partial upload is never served.
+        """
+
+        path = self.path(name)
+        reader = HashingReader(fileobj, max_size)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(reader, f, COPY_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return {"size": reader.size, "sha256": reader.sha256.hexdigest()}
+
+    def get(self, name, max_size=MAX_UPLOAD_SIZE):
+        """Return the bytes stored as name, raising UploadTooLarge past max_size bytes."""
+
+        with open(self.path(name), "rb") as f:
+            data = f.read(max_size + 1)
+        if len(data) > max_size:
+            raise UploadTooLarge(f"Upload is larger than {max_size} bytes.")
+        return data
+
+    def url(self, name):
+        """Return a URL the browser can load name from."""
+
+        return f"{self.url_prefix}/{name}"
+
+    def upload_policy(self, name, max_size=MAX_UPLOAD_SIZE):
+        """Return the URL and form fields for a browser to upload an image straight to name, like an S3 presigned POST."""
+
+        policy = self.policies.dumps({"key": name, "max_size": max_size})
+        return {"url": f"{self.url_prefix}/upload", "fields": {"key": name, "policy": policy}}
+
+    def check_policy(self, policy):
+        """Return the name and size limit a policy from upload_policy allows.
+
+        Raises itsdangerous.BadData if it was tampered with or has expired.
+        """
+
+        return self.policies.loads(policy, max_age=UPLOAD_POLICY_WINDOW)
+
+    def delete(self, name):
+        """Delete name, if it exists."""
+
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def delete_many(self, names):
+        """Delete names, returning a {"Key", "Code", "Message"} dict for each that couldn't be."""
+
+        failed = []
+        for name in dict.fromkeys(name for name in names if name):
+            try:
+                self.delete(name)
+            except (OSError, ValueError) as e:
+                failed.append({"Key": name, "Code": type(e).__name__, "Message": str(e)})
+        return failed
+
+    def list(self):
+        """Yield the (name, last modified) of each stored image, in name order."""
+
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith(".upload-"):
+                continue # still being written
+            try:
+                modified = os.stat(os.path.join(self.root, name)).st_mtime
+            except FileNotFoundError:
+                continue # deleted while listing
+            yield name, datetime.fromtimestamp(modified, timezone.utc)
+
+
+storages = {}
+
+
+def get_storage(config):
+    """Return the storage backend chosen by config, creating it on first use."""
+
+    backend = config.get('STORAGE_BACKEND', 's3')
+    if backend == "s3":
+        key = (backend, config.get('S3_BUCKET'))
+    elif backend == "local":
+        key = (backend, config.get('LOCAL_STORAGE_DIR', 'media'))
+    else:
+        raise ValueError(f"Unknown storage backend: {backend!r}")
+
+    if key not in storages:
+        storages[key] = S3Storage(key[1]) if backend == "s3" else LocalStorage(key[1], secret_key=config.get('SECRET_KEY'))
+    return storages[key]
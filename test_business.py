@@ -0,0 +1,65 @@
+"""Business record tests."""
+
+from unittest import TestCase
+
+from business import Business
+
+
+YELP_DATA = {
+    "id": "denver-roasters-denver",
+    "name": "Denver Roasters",
+    "image_url": "https://example.com/roasters.jpg",
+    "categories": [{"title": "Coffee Roasteries"}, {"title": "Cafes"}],
+    "price": "$$",
+    "phone": "+13035550100",
+    "location": {"display_address": ["1 Main St", "Denver, CO 80202"]},
+    "url": "https://www.yelp.com/biz/denver-roasters-denver",
+    "rating": 4.5
+}
+
+
+class BusinessTestCase(TestCase):
+    """Test building and serializing businesses."""
+
+    def test_from_yelp(self):
+        """Test Yelp's JSON is reduced to the displayed fields."""
+
+        business = Business.from_yelp(YELP_DATA)
+
+        self.assertEqual(business.place_id, "denver-roasters-denver")
+        self.assertEqual(business.category, "Coffee Roasteries")
+        self.assertEqual(business.address_1, "Denver, CO 80202")
+        self.assertEqual(business.rating, "static/images/stars/regular_4_half.png")
+        self.assertFalse(hasattr(business, "__dict__"))
+
+
+    def test_from_yelp_optional_fields(self):
+        """Test missing price and phone, a one line address and a whole number rating."""
+
+        data = dict(YELP_DATA, location={"display_address": ["Denver, CO"]}, rating=4)
+        del data["price"]
+        del data["phone"]
+
+        business = Business.from_yelp(data)
+
+        self.assertEqual(business.price, "")
+        self.assertEqual(business.phone, "")
+        self.assertEqual(business.address_1, "")
+        self.assertEqual(business.rating, "static/images/stars/regular_4.png")
+
+
+    def test_from_yelp_incomplete(self):
+        """Test a business without categories can't be built."""
+
+        with self.assertRaises(IndexError):
+            Business.from_yelp(dict(YELP_DATA, categories=[]))
+
+
+    def test_round_trip(self):
+        """Test to_dict output builds an equal business, whichever way it was cached."""
+
+        business = Business.from_yelp(YELP_DATA)
+
+        self.assertEqual(Business.from_dict(business.to_dict()), business)
+        self.assertEqual(Business.from_cache(business.to_dict()), business)
+        self.assertEqual(Business.from_cache(YELP_DATA), business)
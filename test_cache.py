@@ -0,0 +1,111 @@
+"""Cache tests."""
+
+import threading
+import time
+from unittest import TestCase
+
+from cache import TTLCache, SingleFlight
+
+
+class TTLCacheTestCase(TestCase):
+    """Test the in-process LRU cache."""
+
+    def test_get_and_set(self):
+        """Test values can be cached and counted."""
+
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("coffee", {"name": "Coffee Shop"})
+
+        self.assertEqual(cache.get("coffee"), {"name": "Coffee Shop"})
+        self.assertIsNone(cache.get("tea"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+    def test_expiry(self):
+        """Test entries are missing once their TTL has passed."""
+
+        cache = TTLCache(maxsize=10, ttl=0.01)
+        cache.set("coffee", 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("coffee"))
+        self.assertEqual(len(cache), 0)
+
+
+    def test_stale_window(self):
+        """Test expired entries can still be had from get_stale until stale_ttl passes."""
+
+        cache = TTLCache(maxsize=10, ttl=0.01, stale_ttl=0.05)
+        cache.set("coffee", 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get("coffee"))
+        self.assertEqual(cache.get_stale("coffee"), 1)
+
+        time.sleep(0.05)
+        self.assertIsNone(cache.get_stale("coffee"))
+
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted when full."""
+
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class SingleFlightTestCase(TestCase):
+    """Test coalescing of concurrent identical calls."""
+
+    def test_concurrent_calls_coalesce(self):
+        """Test callers waiting on the same key share one call."""
+
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow_search():
+            calls.append(1)
+            started.set()
+            release.wait(1)
+            return {"businesses": []}
+
+        leader = threading.Thread(target=lambda: results.append(flight.do("coffee", slow_search)))
+        leader.start()
+        started.wait(1)
+
+        followers = [threading.Thread(target=lambda: results.append(flight.do("coffee", slow_search))) for _ in range(4)]
+        for follower in followers:
+            follower.start()
+        time.sleep(0.05)
+        release.set()
+
+        for thread in [leader] + followers:
+            thread.join(1)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"businesses": []}] * 5)
+
+
+    def test_errors_are_shared_then_cleared(self):
+        """Test a failed call raises, and the next call runs again."""
+
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("upstream error")
+
+        with self.assertRaises(ValueError):
+            flight.do("coffee", fail)
+
+        self.assertEqual(flight.do("coffee", lambda: "ok"), "ok")
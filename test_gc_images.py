@@ -0,0 +1,122 @@
+"""Orphaned image collector tests."""
+
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from models import db, User, Log, Maintenance, Location, StoredImage
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+import app  # noqa: F401 - connects db to the test database, which create_all below needs
+
+import gc_images
+from gc_images import collect, find_orphans
+from storage import LocalStorage
+
+db.create_all()
+
+
+class FindOrphansTestCase(TestCase):
+    """Test the sorted merge of stored and referenced names."""
+
+    def test_merge(self):
+        """Test only stored names missing from the referenced ones are yielded."""
+
+        stored = [("a.png", 1), ("b.png", 2), ("c.png", 3), ("e.png", 4)]
+        referenced = ["a.png", "c.png", "d.png"]
+
+        self.assertEqual(list(find_orphans(stored, referenced)), [("b.png", 2), ("e.png", 4)])
+
+
+    def test_nothing_referenced(self):
+        """Test everything is an orphan when nothing is referenced."""
+
+        self.assertEqual(list(find_orphans([("a.png", 1)], [])), [("a.png", 1)])
+
+
+class CollectTestCase(TestCase):
+    """Test orphaned images are found and deleted."""
+
+    def setUp(self):
+        """Store images for a user and a log, plus some nothing uses."""
+
+        User.query.delete()
+        Maintenance.query.delete()
+        Log.query.delete()
+        Location.query.delete()
+        StoredImage.query.delete()
+
+        user = User.signup(username="testuser", email="test@test.com", password="Test_Password123")
+        user.image_name = "user.png"
+        location = Location(location="Salt Lake City, UT")
+        db.session.add(location)
+        db.session.commit()
+
+        db.session.add(Log(user_id=user.id, date='2021-5-1', location_id=location.id, title="Road Trip",
+            text="Drove", image_name="log.png"))
+        db.session.add(StoredImage(name="uploading.png"))
+        db.session.commit()
+
+        self.storage = LocalStorage(tempfile.mkdtemp())
+        for name in ["user.png", "log.png", "log.png.thumb.webp", "uploading.png", "orphan.png", "orphan.png.thumb.webp"]:
+            self.storage.put(name, io.BytesIO(b"image data"))
+
+        old = time.time() - 2 * gc_images.DEFAULT_MIN_AGE
+        for name in os.listdir(self.storage.root):
+            os.utime(os.path.join(self.storage.root, name), (old, old))
+
+
+    def tearDown(self):
+        """Clean up after tests."""
+
+        db.session.rollback()
+        shutil.rmtree(self.storage.root)
+
+
+    def collect(self, **kwargs):
+        """Run the collector, returning its counts and report"""
+
+        lines = []
+        with db.engine.connect() as connection:
+            counts = collect(self.storage, connection, report=lines.append, **kwargs)
+        return counts, lines
+
+
+    def stored(self):
+        """List the names left in storage"""
+
+        return [name for name, modified in self.storage.list()]
+
+
+    def test_dry_run(self):
+        """Test a dry run reports orphans without deleting them."""
+
+        counts, lines = self.collect(dry_run=True)
+
+        self.assertEqual(counts, {"found": 2, "deleted": 0, "failed": 0})
+        self.assertEqual(lines, ["would delete orphan.png", "would delete orphan.png.thumb.webp"])
+        self.assertEqual(len(self.stored()), 6)
+
+
+    def test_deletes_orphans(self):
+        """Test only images and variants nothing references are deleted."""
+
+        counts, lines = self.collect()
+
+        self.assertEqual(counts, {"found": 2, "deleted": 2, "failed": 0})
+        self.assertEqual(self.stored(), ["log.png", "log.png.thumb.webp", "uploading.png", "user.png"])
+
+
+    def test_recent_images_kept(self):
+        """Test images newer than min_age are left for uploads in progress."""
+
+        self.storage.put("new-orphan.png", io.BytesIO(b"image data"))
+
+        counts, lines = self.collect()
+
+        self.assertEqual(counts["deleted"], 2)
+        self.assertIn("new-orphan.png", self.stored())
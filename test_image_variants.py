@@ -0,0 +1,77 @@
+"""Image variant tests."""
+
+import io
+from unittest import TestCase
+
+from PIL import Image
+
+from image_variants import VARIANTS, make_variants, srcset, variant_name
+
+
+def make_image(width, height, mode="RGB", image_format="JPEG"):
+    """Build an image file's bytes."""
+
+    out = io.BytesIO()
+    Image.new(mode, (width, height), "red").save(out, image_format)
+    return out.getvalue()
+
+
+class ImageVariantsTestCase(TestCase):
+    """Test resized copies of uploads."""
+
+    def test_variant_sizes(self):
+        """Test each variant is WebP and no larger than its size."""
+
+        variants = make_variants(make_image(4000, 3000))
+
+        self.assertEqual(set(variants), set(VARIANTS))
+        for variant, (data, width) in variants.items():
+            with Image.open(io.BytesIO(data)) as image:
+                self.assertEqual(image.format, "WEBP")
+                self.assertEqual(image.size, (VARIANTS[variant], VARIANTS[variant] * 3 // 4))
+                self.assertEqual(width, image.width)
+
+
+    def test_small_images_not_enlarged(self):
+        """Test images smaller than a variant keep their size."""
+
+        variants = make_variants(make_image(500, 400, mode="RGBA", image_format="PNG"))
+
+        with Image.open(io.BytesIO(variants["full"].data)) as image:
+            self.assertEqual(image.size, (500, 400))
+        with Image.open(io.BytesIO(variants["thumb"].data)) as image:
+            self.assertEqual(image.size, (320, 256))
+        self.assertEqual({variant: width for variant, (data, width) in variants.items()}, {"full": 500, "medium": 500, "thumb": 320})
+
+
+    def test_portrait_widths(self):
+        """Test a portrait image's variants report their width, not their capped longest side."""
+
+        variants = make_variants(make_image(1000, 2000))
+
+        self.assertEqual({variant: width for variant, (data, width) in variants.items()}, {"full": 800, "medium": 400, "thumb": 160})
+
+
+    def test_not_an_image(self):
+        """Test data Pillow can't read is refused."""
+
+        with self.assertRaises(OSError):
+            make_variants(b"image data")
+
+
+    def test_srcset(self):
+        """Test srcset lists every variant's URL with its real width."""
+
+        urls = {variant: f"https://bucket/{variant_name('car.png', variant)}" for variant in VARIANTS}
+
+        self.assertEqual(srcset(urls, {"full": 1200, "medium": 600, "thumb": 240}),
+            "https://bucket/car.png.full.webp 1200w, https://bucket/car.png.medium.webp 600w, https://bucket/car.png.thumb.webp 240w")
+
+
+    def test_srcset_same_widths(self):
+        """Test variants no narrower than a larger one are left out of srcset."""
+
+        urls = {variant: f"https://bucket/{variant_name('car.png', variant)}" for variant in VARIANTS}
+
+        self.assertEqual(srcset(urls, {"full": 500, "medium": 500, "thumb": 320}),
+            "https://bucket/car.png.full.webp 500w, https://bucket/car.png.thumb.webp 320w")
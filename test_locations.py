@@ -0,0 +1,95 @@
+"""Location resolver tests."""
+
+import os
+from unittest import TestCase
+
+from models import db, User, Log, Maintenance, Location
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+import app  # noqa: F401 - connects db to the test database, which create_all below needs
+
+from locations import location_cache, normalize, resolve_location
+
+db.create_all()
+
+
+class NormalizeTestCase(TestCase):
+    """Test location text is tidied."""
+
+    def test_whitespace(self):
+        """Test surrounding whitespace is stripped and inner runs collapsed."""
+
+        self.assertEqual(normalize("  Salt Lake   City,\tUT "), "Salt Lake City, UT")
+
+
+    def test_none(self):
+        """Test a missing location is empty."""
+
+        self.assertEqual(normalize(None), "")
+
+
+class ResolveLocationTestCase(TestCase):
+    """Test locations are found or added."""
+
+    def setUp(self):
+        """Start with one location."""
+
+        User.query.delete()
+        Maintenance.query.delete()
+        Log.query.delete()
+        Location.query.delete()
+
+        location = Location(location="Salt Lake City, UT")
+        db.session.add(location)
+        db.session.commit()
+
+        self.location_id = location.id
+
+
+    def tearDown(self):
+        """Clean up after tests."""
+
+        db.session.rollback()
+
+
+    def test_existing(self):
+        """Test an existing location is found, ignoring case and whitespace."""
+
+        self.assertEqual(resolve_location(" salt lake  city, ut"), self.location_id)
+        self.assertEqual(Location.query.count(), 1)
+
+
+    def test_new(self):
+        """Test a new location is added, tidied, and cached once committed."""
+
+        location_id = resolve_location(" Las  Vegas, NV ")
+
+        self.assertEqual(Location.query.get(location_id).location, "Las Vegas, NV")
+        self.assertIsNone(location_cache.get("las vegas, nv"))
+
+        db.session.commit()
+
+        self.assertEqual(location_cache.get("las vegas, nv"), location_id)
+        self.assertEqual(resolve_location("LAS VEGAS, NV"), location_id)
+
+
+    def test_rolled_back(self):
+        """Test a location added in a rolled back transaction isn't cached."""
+
+        resolve_location("Ames, IA")
+        db.session.rollback()
+
+        self.assertIsNone(location_cache.get("ames, ia"))
+        location_id = resolve_location("Ames, IA")
+        self.assertIsNotNone(Location.query.get(location_id))
+
+
+    def test_bulk_delete_clears_cache(self):
+        """Test deleting locations in bulk forgets their ids."""
+
+        resolve_location("Sherman, TX")
+        db.session.commit()
+        Location.query.delete()
+
+        self.assertEqual(len(location_cache), 0)
@@ -1,8 +1,14 @@
 """Log entry view tests."""
 
+import html as html_escape
+import json
 import os
+import re
+import shutil
+import tempfile
 from io import BytesIO
 from unittest import TestCase
+from unittest.mock import patch
 from flask import url_for
 
 from models import db, connect_db, User, Log, Maintenance, Location
@@ -10,6 +16,7 @@ from models import db, connect_db, User, Log, Maintenance, Location
 os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
 
 from app import app, CURR_USER_KEY
+from upload_worker import Staged
 
 db.create_all()
 
@@ -141,6 +148,67 @@ class LogViewTestCase(TestCase):
             self.assertEqual(res.status_code, 200)
             self.assertIn("""<h2 class="dark-title">my test log</h2>""", html)
 
+
+
+    def test_enter_log_direct_upload(self):
+        """Test a log can be entered with a photo the browser uploaded straight to storage."""
+
+        local_dir = tempfile.mkdtemp()
+        with self.client as c, patch.dict(app.config, STORAGE_BACKEND='local', LOCAL_STORAGE_DIR=local_dir), \
+                patch("app.queue_upload") as queue_upload:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.test_user_one.id
+
+            html = c.get('/logs/new').get_data(as_text=True)
+            policy = json.loads(html_escape.unescape(re.search(r"data-upload-policy='([^']*)'", html).group(1)))
+            self.assertEqual(policy["url"], "/media/upload")
+
+            data = {
+                "title": "my test log",
+                "location": "Chicago, IL",
+                "mileage" : 59000,
+                "date": "2020-10-26",
+                "photo": (BytesIO(b''), ''),
+                "photo_key": policy["photo_key"],
+                "photo_name": "car.PNG",
+                "text": "This is a test log."}
+
+            res = c.post('/logs/new', content_type="multipart/form-data", data=data)
+
+            self.assertEqual(res.status_code, 302)
+            log = Log.query.filter_by(title="my test log").first()
+            self.assertEqual(log.image_name, policy["fields"]["key"])
+            self.assertTrue(log.image_pending)
+            photo = queue_upload.call_args.args[3]
+            self.assertEqual(photo, Staged(policy["fields"]["key"], ".png", "image/png"))
+
+        shutil.rmtree(local_dir)
+
+
+    def test_enter_log_forged_upload(self):
+        """Test a photo key that wasn't issued to this user is refused."""
+
+        with self.client as c, patch("app.queue_upload") as queue_upload:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.test_user_one.id
+
+            data = {
+                "title": "my test log",
+                "location": "Chicago, IL",
+                "mileage" : 59000,
+                "date": "2020-10-26",
+                "photo": (BytesIO(b''), ''),
+                "photo_key": "forged",
+                "photo_name": "car.png",
+                "text": "This is a test log."}
+
+            res = c.post('/logs/new', content_type="multipart/form-data", data=data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertIn("Your photo upload expired.", res.get_data(as_text=True))
+            self.assertIsNone(Log.query.filter_by(title="my test log").first())
+            queue_upload.assert_not_called()
+
             
     def test_view_log(self):
         """Test view log."""
@@ -157,6 +225,32 @@ class LogViewTestCase(TestCase):
             self.assertIn("""<p class="rounded mt-2 p-3 border text-bg">Second test log.</p>""", html)
 
     
+    def test_all_logs_paged(self):
+        """Test all of a user's logs are shown a page at a time, newest first."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.test_user_one_id
+
+            with patch.dict(app.config, {'RECORDS_PER_PAGE': 1}):
+                res = c.get('/logs/all')
+                html = res.get_data(as_text=True)
+
+                self.assertEqual(res.status_code, 200)
+                self.assertIn("First Test Title.", html)
+                self.assertIn("Salt Lake City, UT", html)
+                self.assertNotIn("Third Test Title.", html)
+                self.assertIn(f'href="/logs/all?after=2021-05-01_{self.first_test_log_id}"', html)
+
+                res = c.get(f'/logs/all?after=2021-05-01_{self.first_test_log_id}')
+                html = res.get_data(as_text=True)
+
+                self.assertIn("Third Test Title.", html)
+                self.assertNotIn("First Test Title.", html)
+                self.assertNotIn("?after=", html)
+                self.assertIn('href="/logs/all"', html)
+
+
     def test_edit_log(self):
         """Test edit log."""
 
@@ -204,6 +298,17 @@ class LogViewTestCase(TestCase):
             self.assertEqual(len(log), 0)
 
 
+    def test_view_missing_log(self):
+        """Test a log that doesn't exist is not found."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.test_user_one_id
+
+            self.assertEqual(c.get('/logs/999999').status_code, 404)
+            self.assertEqual(c.post('/logs/999999/delete').status_code, 404)
+
+
     def test_view_other_user_log(self):
         """Test view attempt on a different user's log."""
 
@@ -211,11 +316,9 @@ class LogViewTestCase(TestCase):
             with c.session_transaction() as sess:
                 sess[CURR_USER_KEY] = self.test_user_two_id
 
-            res = c.get(f'/logs/{self.first_test_log_id}', follow_redirects=True)
-            html = res.get_data(as_text=True)
+            res = c.get(f'/logs/{self.first_test_log_id}')
 
-            self.assertEqual(res.status_code, 200)
-            self.assertIn("""<h2 class="dark-title">New Log Entry</h2>""", html)
+            self.assertEqual(res.status_code, 403)
 
 
     def test_delete_other_user_log(self):
@@ -225,10 +328,8 @@ class LogViewTestCase(TestCase):
             with c.session_transaction() as sess:
                 sess[CURR_USER_KEY] = self.test_user_one_id
 
-            res = c.post(f'/logs/{self.second_test_log_id}/delete', follow_redirects=True)
-            html = res.get_data(as_text=True)
-            self.assertEqual(res.status_code, 200)
-            self.assertIn("""<h2 class="dark-title">New Log Entry</h2>""", html)
+            res = c.post(f'/logs/{self.second_test_log_id}/delete')
+            self.assertEqual(res.status_code, 403)
 
             # verify log still exists
             log = Log.query.filter_by(id=self.second_test_log_id).all()
@@ -250,11 +351,10 @@ class LogViewTestCase(TestCase):
                 "photo": (BytesIO(b'image data'), ''),
                 "text": "This is an edit for another user's log."}
 
-            res = c.post(f'/logs/{self.second_test_log_id}/edit', data=data, follow_redirects=True)
-            html = res.get_data(as_text=True)
+            res = c.post(f'/logs/{self.second_test_log_id}/edit', data=data)
 
-            self.assertEqual(res.status_code, 200)
-            self.assertIn("""<h2 class="dark-title">New Log Entry</h2>""", html)
+            self.assertEqual(res.status_code, 403)
+            self.assertNotEqual(Log.query.get(self.second_test_log_id).title, data["title"])
 
 
     def test_logged_out_submit(self):
@@ -3,6 +3,7 @@
 import os
 from io import BytesIO
 from unittest import TestCase
+from unittest.mock import patch
 from flask import url_for
 
 from models import db, connect_db, User, Maintenance, Location
@@ -155,6 +156,32 @@ class MaintenanceViewTestCase(TestCase):
             self.assertIn("""<p class="rounded mt-2 p-3 text-bg border">Second test record.</p>""", html)
 
                 
+    def test_all_maintenance_paged(self):
+        """Test all of a user's maintenance records are shown a page at a time, newest first."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.test_user_one_id
+
+            with patch.dict(app.config, {'RECORDS_PER_PAGE': 1}):
+                res = c.get('/maintenance/all')
+                html = res.get_data(as_text=True)
+
+                self.assertEqual(res.status_code, 200)
+                self.assertIn("First Test Title.", html)
+                self.assertIn("Salt Lake City, UT", html)
+                self.assertNotIn("Third Test Title.", html)
+                self.assertIn(f'href="/maintenance/all?after=2021-05-01_{self.first_test_maintenance_id}"', html)
+
+                res = c.get(f'/maintenance/all?after=2021-05-01_{self.first_test_maintenance_id}')
+                html = res.get_data(as_text=True)
+
+                self.assertIn("Third Test Title.", html)
+                self.assertNotIn("First Test Title.", html)
+                self.assertNotIn("?after=", html)
+                self.assertIn('href="/maintenance/all"', html)
+
+
     def test_edit_maintenance(self):
         """Test edit maintenance."""
 
@@ -202,6 +229,17 @@ class MaintenanceViewTestCase(TestCase):
             self.assertEqual(len(maintenance), 0)
 
 
+    def test_view_missing_maintenance(self):
+        """Test a maintenance record that doesn't exist is not found."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.test_user_one_id
+
+            self.assertEqual(c.get('/maintenance/999999').status_code, 404)
+            self.assertEqual(c.post('/maintenance/999999/delete').status_code, 404)
+
+
     def test_view_other_user_maintenance(self):
         """Test view attempt on a different user's maintenance record."""
 
@@ -209,11 +247,9 @@ class MaintenanceViewTestCase(TestCase):
             with c.session_transaction() as sess:
                 sess[CURR_USER_KEY] = self.test_user_two_id
 
-            res = c.get(f'/maintenance/{self.first_test_maintenance_id}', follow_redirects=True)
-            html = res.get_data(as_text=True)
+            res = c.get(f'/maintenance/{self.first_test_maintenance_id}')
 
-            self.assertEqual(res.status_code, 200)
-            self.assertIn("""<h2 class="dark-title">New Maintenance Record</span></h2>""", html)
+            self.assertEqual(res.status_code, 403)
 
 
     def test_delete_other_user_maintenance(self):
@@ -223,10 +259,8 @@ class MaintenanceViewTestCase(TestCase):
             with c.session_transaction() as sess:
                 sess[CURR_USER_KEY] = self.test_user_one_id
 
-            res = c.post(f'/maintenance/{self.second_test_maintenance_id}/delete', follow_redirects=True)
-            html = res.get_data(as_text=True)
-            self.assertEqual(res.status_code, 200)
-            self.assertIn("""<h2 class="dark-title">New Maintenance Record</span></h2>""", html)
+            res = c.post(f'/maintenance/{self.second_test_maintenance_id}/delete')
+            self.assertEqual(res.status_code, 403)
 
             # verify maintenance still exists
             maintenance = Maintenance.query.filter_by(id=self.second_test_maintenance_id).all()
@@ -248,11 +282,10 @@ class MaintenanceViewTestCase(TestCase):
                 "photo": (BytesIO(b'image data'), ''),
                 "description": "This is an edit for another user's maintenance record."}
 
-            res = c.post(f'/maintenance/{self.second_test_maintenance_id}/edit', data=data, follow_redirects=True)
-            html = res.get_data(as_text=True)
+            res = c.post(f'/maintenance/{self.second_test_maintenance_id}/edit', data=data)
 
-            self.assertEqual(res.status_code, 200)
-            self.assertIn("""<h2 class="dark-title">New Maintenance Record</span></h2>""", html)
+            self.assertEqual(res.status_code, 403)
+            self.assertNotEqual(Maintenance.query.get(self.second_test_maintenance_id).title, data["title"])
 
 
     def test_logged_out_submit(self):
@@ -0,0 +1,203 @@
+"""Saved place view tests."""
+
+import gzip
+import json
+import os
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from datetime import datetime, timedelta
+
+from models import db, User, Place, CachedBusiness, UsersPlaces
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+from app import app, CURR_USER_KEY
+
+import yelp_client
+import yelp_governor
+from yelp_functions import business_cache, search_cache
+from yelp_standin import DEFAULT_CASSETTE
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+with open(DEFAULT_CASSETTE) as f:
+    CASSETTE = json.load(f)
+
+
+def fake_get(url, **kwargs):
+    """Answer business lookups from the stand-in's cassette."""
+
+    business = CASSETTE["businesses"].get(url.rsplit("/", 1)[1])
+    if url.endswith("/search"):
+        business = CASSETTE["search"]["coffee|denver, co"]
+
+    res = MagicMock()
+    res.status_code = 200 if business else 404
+    res.ok = bool(business)
+    res.json.return_value = business or {"error": {"code": "BUSINESS_NOT_FOUND"}}
+    if not business:
+        res.raise_for_status.side_effect = yelp_client.requests.HTTPError()
+    return res
+
+
+class PlaceViewTestCase(TestCase):
+    """Test views for saved places."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        self.client = app.test_client()
+
+        db.session.execute("DELETE FROM users_places")
+        User.query.delete()
+        Place.query.delete()
+        CachedBusiness.query.delete()
+        business_cache.clear()
+        yelp_governor.reset()
+
+        self.user = User.signup(username="testuser",
+                                email="test@test.com",
+                                password="Test_Password123")
+        db.session.commit()
+
+        for place_id in ["union-station-camp-denver", "closed-for-good", "denver-roasters-denver"]:
+            place = Place(id=place_id)
+            db.session.add(place)
+            self.user.places.append(place)
+        db.session.commit()
+
+        self.user_id = self.user.id
+
+
+    def tearDown(self):
+        """Clean up after tests."""
+
+        db.session.rollback()
+        business_cache.clear()
+
+        db.session.execute("DELETE FROM users_places")
+        User.query.delete()
+        db.session.commit()
+
+
+    def test_show_places_streamed(self):
+        """Test saved places are streamed in saved order, skipping failed lookups."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            with patch.object(yelp_client.session, "get", side_effect=fake_get):
+                res = c.get('/places')
+                html = res.get_data(as_text=True)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.headers["X-Accel-Buffering"], "no")
+            self.assertIn("Union Station Camp", html)
+            self.assertIn("Denver Roasters", html)
+            self.assertNotIn("closed-for-good", html)
+            self.assertLess(html.index("Denver Roasters"), html.index("Union Station Camp")) # newest first
+
+
+    def test_show_places_not_streamed(self):
+        """Test the page can still be rendered in one piece."""
+
+        app.config['STREAM_PLACES'] = False
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.user_id
+
+                with patch.object(yelp_client.session, "get", side_effect=fake_get):
+                    res = c.get('/places')
+                    html = res.get_data(as_text=True)
+        finally:
+            app.config['STREAM_PLACES'] = True
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("X-Accel-Buffering", res.headers)
+        self.assertIn("Denver Roasters", html)
+
+
+    def test_show_places_paged(self):
+        """Test only the current page is looked up, newest first, and the next page is prefetched."""
+
+        now = datetime.utcnow()
+        for age, place_id in enumerate(["denver-roasters-denver", "closed-for-good", "union-station-camp-denver"]):
+            UsersPlaces.query.filter_by(user_id=self.user_id, place_id=place_id).update({"saved_at": now - timedelta(days=age)})
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            with patch("app.PLACES_PER_PAGE", 1), \
+                    patch("app.prefetch_businesses") as prefetch, \
+                    patch.object(yelp_client.session, "get", side_effect=fake_get) as get:
+                res = c.get('/places?page=1')
+                html = res.get_data(as_text=True)
+
+            self.assertIn("Denver Roasters", html)
+            self.assertNotIn("Union Station Camp", html)
+            self.assertIn('href="/places?page=2"', html)
+            self.assertEqual(get.call_count, 1)
+            prefetch.assert_called_once()
+            self.assertEqual(prefetch.call_args.args[2], ["closed-for-good"])
+
+            with patch("app.PLACES_PER_PAGE", 1), \
+                    patch.object(yelp_client.session, "get", side_effect=fake_get):
+                res = c.get('/places?page=3')
+                html = res.get_data(as_text=True)
+
+            self.assertIn("Union Station Camp", html)
+            self.assertIn('href="/places?page=2"', html)
+            self.assertNotIn('href="/places?page=4"', html)
+
+
+    def test_logged_out_places(self):
+        """Test places require a login."""
+
+        res = self.client.get('/places')
+
+        self.assertEqual(res.status_code, 302)
+
+
+class SearchViewTestCase(TestCase):
+    """Test the business search route."""
+
+    def setUp(self):
+        """Create test client."""
+
+        self.client = app.test_client()
+        search_cache.clear()
+        yelp_governor.reset()
+
+
+    def test_search_projection(self):
+        """Test only the displayed fields are returned, with the star image path filled in."""
+
+        with patch.object(yelp_client.session, "get", side_effect=fake_get):
+            res = self.client.post('/search', json={"category": "coffee", "city": "Denver, CO"})
+
+        self.assertEqual(res.status_code, 200)
+        business = res.json["businesses"][0]
+        self.assertEqual(business["place_id"], "denver-roasters-denver")
+        self.assertEqual(business["rating"], "static/images/stars/regular_4_half.png")
+        self.assertEqual(business["address_1"], "Denver, CO 80202")
+        self.assertNotIn("coordinates", business)
+        self.assertNotIn("transactions", business)
+
+
+    def test_search_gzip(self):
+        """Test results are compressed for browsers that accept gzip."""
+
+        with patch.object(yelp_client.session, "get", side_effect=fake_get):
+            res = self.client.post('/search', json={"category": "coffee", "city": "Denver, CO"}, headers={"Accept-Encoding": "gzip, deflate"})
+
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", res.headers["Vary"])
+        businesses = json.loads(gzip.decompress(res.get_data()))["businesses"]
+        self.assertEqual(len(businesses), 2)
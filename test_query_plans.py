@@ -0,0 +1,52 @@
+"""Query plan tests."""
+
+import os
+from unittest import TestCase
+
+from models import db
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+import app  # noqa: F401 - connects db to the test database, which create_all below needs
+
+from query_plans import explain, hot_queries, plan_nodes
+
+db.create_all()
+
+
+class QueryPlanTestCase(TestCase):
+    """Test the hot queries are served from their indexes."""
+
+    def setUp(self):
+        """Plan as if the tables were large.
+
+        The test tables are tiny, so Postgres would rightly read them whole, or gather their rows with a bitmap scan and sort them. With both priced out, it has to read an index in order, and can only skip sorting if the index matches the query.
+        """
+
+        db.session.execute("SET LOCAL enable_seqscan = off")
+        db.session.execute("SET LOCAL enable_bitmapscan = off")
+
+
+    def tearDown(self):
+        """Clean up after tests."""
+
+        db.session.rollback()
+
+
+    def test_hot_queries_use_indexes(self):
+        """Test each hot query reads its index in order, without any kind of sort."""
+
+        for name, (query, index) in hot_queries(user_id=1, place_id="abc").items():
+            with self.subTest(name):
+                nodes = list(plan_nodes(explain(query)))
+
+                self.assertIn(index, [node.get("Index Name") for node in nodes])
+                self.assertFalse([node["Node Type"] for node in nodes if "Sort" in node["Node Type"]]) # Sort or Incremental Sort
+
+
+    def test_text_plan(self):
+        """Test plans can be shown as text."""
+
+        query, index = hot_queries(user_id=1, place_id="abc")["recent_logs"]
+
+        self.assertTrue(any(index in line for line in explain(query, format="text")))
@@ -0,0 +1,27 @@
+"""Record page cursor tests."""
+
+from datetime import date
+from types import SimpleNamespace
+from unittest import TestCase
+
+from record_pages import decode_cursor, encode_cursor
+
+
+class CursorTestCase(TestCase):
+    """Test page cursors round trip, and bad ones are ignored."""
+
+    def test_round_trip(self):
+        """Test a record's cursor decodes to its (date, id)."""
+
+        record = SimpleNamespace(date=date(2021, 5, 1), id=101)
+
+        self.assertEqual(encode_cursor(record), "2021-05-01_101")
+        self.assertEqual(decode_cursor(encode_cursor(record)), (date(2021, 5, 1), 101))
+
+
+    def test_malformed(self):
+        """Test missing or malformed cursors start from the first page."""
+
+        for cursor in [None, "", "2021-05-01", "yesterday_1", "2021-05-01_x", "2021-05-01_1_2"]:
+            with self.subTest(cursor):
+                self.assertIsNone(decode_cursor(cursor))
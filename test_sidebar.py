@@ -0,0 +1,141 @@
+"""Sidebar tests."""
+
+import os
+from io import BytesIO
+from unittest import TestCase
+from flask import g, session
+
+from models import db, User, Log, Maintenance, Location
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+from app import app, CURR_USER_KEY
+
+from sidebar import Entry, fetch_sidebar, sidebar_cache, USER_KEY, VERSION_KEY
+
+db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class SidebarTestCase(TestCase):
+    """Test the recent logs and maintenance records sidebar."""
+
+    def setUp(self):
+        """Add a user with a few logs and a maintenance record."""
+
+        self.client = app.test_client()
+
+        User.query.delete()
+        Maintenance.query.delete()
+        Log.query.delete()
+        Location.query.delete()
+
+        user = User.signup(username="testuser", email="test@test.com", password="Test_Password123")
+        location = Location(location="Salt Lake City, UT")
+        db.session.add(location)
+        db.session.commit()
+
+        for day in range(1, 8):
+            db.session.add(Log(user_id=user.id, date=f'2021-5-{day}', location_id=location.id, title=f"Day {day}", text="Drove"))
+        db.session.add(Maintenance(user_id=user.id, date='2021-5-3', location_id=location.id, title="Oil Change", description="Changed oil"))
+        db.session.commit()
+
+        self.user_id = user.id
+        self.location_id = location.id
+
+
+    def tearDown(self):
+        """Clean up after tests."""
+
+        db.session.rollback()
+
+
+    def test_fetch_sidebar(self):
+        """Test the latest five of each list are fetched, newest first, with their locations."""
+
+        sidebar = fetch_sidebar(self.user_id)
+
+        self.assertEqual([entry.title for entry in sidebar.logs], ["Day 7", "Day 6", "Day 5", "Day 4", "Day 3"])
+        self.assertEqual(len(sidebar.maintenance), 1)
+        self.assertIsInstance(sidebar.maintenance[0], Entry)
+        self.assertEqual(sidebar.maintenance[0].title, "Oil Change")
+        self.assertEqual(sidebar.maintenance[0].location, "Salt Lake City, UT")
+
+
+    def test_same_date_newest_id_first(self):
+        """Test records from the same day are listed newest first by id."""
+
+        for title in ["Morning", "Evening"]:
+            db.session.add(Log(user_id=self.user_id, date='2021-5-9', location_id=self.location_id, title=title, text="Drove"))
+            db.session.commit()
+
+        self.assertEqual([entry.title for entry in fetch_sidebar(self.user_id).logs[:2]], ["Evening", "Morning"])
+
+
+    def test_sidebar_cached(self):
+        """Test the sidebar is cached after a page shows it."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = c.get("/logs/new")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("Day 7", str(resp.data))
+            self.assertEqual(sidebar_cache.get(self.user_id)[1], fetch_sidebar(self.user_id))
+
+
+    def test_write_invalidates(self):
+        """Test a new log shows up in the sidebar, and bumps the session's sidebar version."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            c.get("/logs/new")
+            data = {
+                "title": "Day 8",
+                "location": "Salt Lake City, UT",
+                "mileage": 100,
+                "date": "2021-05-08",
+                "photo": (BytesIO(b''), ''),
+                "text": "Drove on"}
+            c.post("/logs/new", content_type="multipart/form-data", data=data)
+
+            with c.session_transaction() as sess:
+                self.assertEqual(sess[VERSION_KEY], 1)
+
+            resp = c.get("/logs/new")
+
+            self.assertIn("Day 8", str(resp.data))
+
+
+    def test_writes_in_separate_commits(self):
+        """Test each commit writing the user's logs bumps their sidebar version, even once g.user has expired."""
+
+        with app.test_request_context():
+            session[USER_KEY] = self.user_id
+            g.user = User.query.get(self.user_id)
+
+            for day in (8, 9):
+                db.session.add(Log(user_id=self.user_id, date=f'2021-5-{day}', location_id=self.location_id, title=f"Day {day}", text="Drove"))
+                db.session.commit()
+
+            self.assertEqual(session[VERSION_KEY], 2)
+
+
+    def test_stale_version_refetched(self):
+        """Test a cached sidebar from an older session version is not served."""
+
+        sidebar_cache.set(self.user_id, (0, fetch_sidebar(self.user_id)._replace(maintenance=[])))
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+                sess[VERSION_KEY] = 1
+
+            resp = c.get("/maintenance/new")
+
+            self.assertIn("Oil Change", str(resp.data))
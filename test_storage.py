@@ -0,0 +1,156 @@
+"""Storage backend tests."""
+
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from itsdangerous import BadData
+
+from models import db
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+from app import app
+
+from s3_functions import UploadTooLarge
+from storage import LocalStorage, S3Storage, get_storage
+
+db.create_all()
+
+
+class LocalStorageTestCase(TestCase):
+    """Test images kept on local disk."""
+
+    def setUp(self):
+        """Start with an empty storage directory."""
+
+        self.storage = LocalStorage(tempfile.mkdtemp())
+
+
+    def tearDown(self):
+        """Remove the storage directory."""
+
+        shutil.rmtree(self.storage.root)
+
+
+    def test_put_and_delete(self):
+        """Test images can be stored, listed and deleted."""
+
+        result = self.storage.put("car.png", io.BytesIO(b"image data"))
+
+        self.assertEqual(result["size"], 10)
+        self.assertEqual([name for name, modified in self.storage.list()], ["car.png"])
+        self.assertEqual(self.storage.url("car.png"), "/media/car.png")
+
+        self.assertEqual(self.storage.delete_many(["car.png", "missing.png", ""]), [])
+        self.assertEqual([name for name, modified in self.storage.list()], [])
+
+
+    def test_get(self):
+        """Test stored images can be read back, up to a size limit."""
+
+        self.storage.put("car.png", io.BytesIO(b"image data"))
+
+        self.assertEqual(self.storage.get("car.png"), b"image data")
+        with self.assertRaises(UploadTooLarge):
+            self.storage.get("car.png", max_size=5)
+
+
+    def test_upload_policy(self):
+        """Test upload policies are signed with the name and size they allow."""
+
+        policy = self.storage.upload_policy("incoming-abc", max_size=10)
+
+        self.assertEqual(policy["url"], "/media/upload")
+        self.assertEqual(self.storage.check_policy(policy["fields"]["policy"]), {"key": "incoming-abc", "max_size": 10})
+        with self.assertRaises(BadData):
+            self.storage.check_policy(policy["fields"]["policy"] + "x")
+        with self.assertRaises(BadData):
+            LocalStorage(self.storage.root, secret_key="other").check_policy(policy["fields"]["policy"])
+
+
+    def test_too_large(self):
+        """Test an upload over the size limit leaves nothing behind."""
+
+        with self.assertRaises(UploadTooLarge):
+            self.storage.put("car.png", io.BytesIO(b"x" * 100), max_size=10)
+
+        self.assertEqual(os.listdir(self.storage.root), [])
+
+
+    def test_names_stay_inside_root(self):
+        """Test names can't reach outside the storage directory."""
+
+        with self.assertRaises(ValueError):
+            self.storage.put("../car.png", io.BytesIO(b"image data"))
+
+
+class StorageConfigTestCase(TestCase):
+    """Test the backend is chosen by config."""
+
+    def test_get_storage(self):
+        """Test each backend is built once for its settings."""
+
+        local_dir = tempfile.mkdtemp()
+        config = {"STORAGE_BACKEND": "local", "LOCAL_STORAGE_DIR": local_dir}
+
+        self.assertIsInstance(get_storage({"STORAGE_BACKEND": "s3", "S3_BUCKET": "bucket"}), S3Storage)
+        self.assertIsInstance(get_storage(config), LocalStorage)
+        self.assertIs(get_storage(config), get_storage(dict(config)))
+        with self.assertRaises(ValueError):
+            get_storage({"STORAGE_BACKEND": "ftp"})
+
+        shutil.rmtree(local_dir)
+
+
+    def test_media_route(self):
+        """Test locally stored images are served, and cached by the browser."""
+
+        local_dir = tempfile.mkdtemp()
+        backend, directory = app.config['STORAGE_BACKEND'], app.config['LOCAL_STORAGE_DIR']
+        app.config['STORAGE_BACKEND'] = 'local'
+        app.config['LOCAL_STORAGE_DIR'] = local_dir
+        try:
+            get_storage(app.config).put("car.png", io.BytesIO(b"image data"))
+
+            res = app.test_client().get('/media/car.png')
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.data, b"image data")
+            self.assertIn("max-age", res.headers["Cache-Control"])
+
+            self.assertEqual(app.test_client().get('/media/missing.png').status_code, 404)
+        finally:
+            app.config['STORAGE_BACKEND'] = backend
+            app.config['LOCAL_STORAGE_DIR'] = directory
+            shutil.rmtree(local_dir)
+
+
+    def test_media_upload_route(self):
+        """Test browsers can upload to local storage with a policy, as they would to S3."""
+
+        local_dir = tempfile.mkdtemp()
+        backend, directory = app.config['STORAGE_BACKEND'], app.config['LOCAL_STORAGE_DIR']
+        app.config['STORAGE_BACKEND'] = 'local'
+        app.config['LOCAL_STORAGE_DIR'] = local_dir
+        try:
+            local = get_storage(app.config)
+            fields = local.upload_policy("incoming-abc", max_size=10)["fields"]
+
+            def upload(data, content_type="image/png", **changes):
+                form = dict(fields, **changes)
+                form["Content-Type"] = content_type
+                form["file"] = (io.BytesIO(data), "car.png")
+                return app.test_client().post('/media/upload', content_type="multipart/form-data", data=form)
+
+            self.assertEqual(upload(b"image data").status_code, 204)
+            self.assertEqual(local.get("incoming-abc"), b"image data")
+
+            self.assertEqual(upload(b"image data", policy="forged").status_code, 403)
+            self.assertEqual(upload(b"image data", content_type="text/html").status_code, 400)
+            self.assertEqual(upload(b"x" * 11).status_code, 400)
+        finally:
+            app.config['STORAGE_BACKEND'] = backend
+            app.config['LOCAL_STORAGE_DIR'] = directory
+            shutil.rmtree(local_dir)
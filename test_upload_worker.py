@@ -0,0 +1,287 @@
+"""Background image upload tests."""
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from PIL import Image
+
+from models import db, User, Log, Maintenance, Location, StoredImage
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+from app import app
+
+import upload_worker
+from s3_functions import UploadTooLarge
+from storage import LocalStorage
+from upload_worker import Photo, Staged, add_reference, queue_upload, read_photo, release_images
+
+db.create_all()
+
+
+class UploadWorkerTestCase(TestCase):
+    """Test photos are uploaded in the background and their records marked ready."""
+
+    def setUp(self):
+        """Add a log whose new photo is still uploading."""
+
+        User.query.delete()
+        Maintenance.query.delete()
+        Log.query.delete()
+        Location.query.delete()
+        StoredImage.query.delete()
+
+        user = User.signup(username="testuser", email="test@test.com", password="Test_Password123")
+        location = Location(location="Salt Lake City, UT")
+        db.session.add(location)
+        db.session.commit()
+
+        add_reference("new.png")
+        self.log = Log(user_id=user.id, date='2021-5-1', location_id=location.id, title="Road Trip",
+            text="Drove", image_name="new.png", image_pending=True)
+        db.session.add(self.log)
+        db.session.commit()
+        self.log_id = self.log.id
+        self.photo = Photo("new.png", b"image data", "image/png")
+        self.storage = LocalStorage(tempfile.mkdtemp())
+
+
+    def tearDown(self):
+        """Clean up after tests."""
+
+        db.session.rollback()
+        shutil.rmtree(self.storage.root)
+
+
+    def test_upload_marks_ready(self):
+        """Test a finished upload clears image_pending and deletes the image it replaced."""
+
+        self.storage.put("old.png", io.BytesIO(b"old image"))
+        self.storage.put("old.png.thumb.webp", io.BytesIO(b"old thumbnail"))
+
+        queue_upload(app, self.storage, self.log, self.photo, ("old.png", True)).result(5)
+
+        db.session.expire_all()
+        log = Log.query.get(self.log_id)
+        self.assertFalse(log.image_pending)
+        self.assertFalse(log.image_variants) # not a real image, so it couldn't be resized
+        self.assertEqual(log.image_name, "new.png")
+        self.assertEqual([name for name, modified in self.storage.list()], ["new.png"])
+
+
+    def test_upload_variants(self):
+        """Test resized variants are uploaded alongside the photo."""
+
+        out = io.BytesIO()
+        Image.new("RGB", (2000, 1000)).save(out, "JPEG")
+        photo = Photo("new.png", out.getvalue(), "image/jpeg")
+
+        queue_upload(app, self.storage, self.log, photo).result(5)
+
+        db.session.expire_all()
+        self.assertTrue(Log.query.get(self.log_id).image_variants)
+        self.assertEqual([name for name, modified in self.storage.list()], ["new.png", "new.png.full.webp", "new.png.medium.webp", "new.png.thumb.webp"])
+        self.assertEqual(StoredImage.query.get("new.png").variant_widths, {"full": 1600, "medium": 800, "thumb": 320})
+
+
+    def test_decompression_bomb(self):
+        """Test an image too large to resize safely is stored without variants."""
+
+        out = io.BytesIO()
+        Image.new("RGB", (2000, 1000)).save(out, "JPEG")
+        photo = Photo("new.png", out.getvalue(), "image/jpeg")
+
+        with patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            queue_upload(app, self.storage, self.log, photo).result(5)
+
+        db.session.expire_all()
+        log = Log.query.get(self.log_id)
+        self.assertFalse(log.image_pending)
+        self.assertFalse(log.image_variants)
+        self.assertTrue(StoredImage.query.get("new.png").uploaded)
+        self.assertEqual([name for name, modified in self.storage.list()], ["new.png"])
+
+
+    def test_unexpected_error_clears_pending(self):
+        """Test a record isn't left pending when its upload stops on an unexpected error."""
+
+        self.storage.put("old.png", io.BytesIO(b"old image"))
+
+        with patch.object(upload_worker, "upload_variants", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                queue_upload(app, self.storage, self.log, self.photo, ("old.png", True)).result(5)
+
+        db.session.expire_all()
+        log = Log.query.get(self.log_id)
+        self.assertFalse(log.image_pending)
+        self.assertEqual(log.image_name, "old.png")
+        self.assertTrue(log.image_variants)
+        self.assertIsNone(StoredImage.query.get("new.png"))
+        self.assertEqual([name for name, modified in self.storage.list()], ["old.png"])
+
+
+    def test_failed_upload_restores_previous(self):
+        """Test the previous image is put back if the upload never succeeds."""
+
+        self.storage.put("old.png", io.BytesIO(b"old image"))
+
+        with patch.object(self.storage, "put", side_effect=OSError("disk full")) as upload, \
+                patch.object(upload_worker.time, "sleep"):
+            queue_upload(app, self.storage, self.log, self.photo, ("old.png", True)).result(5)
+
+        db.session.expire_all()
+        log = Log.query.get(self.log_id)
+        self.assertFalse(log.image_pending)
+        self.assertEqual(log.image_name, "old.png")
+        self.assertTrue(log.image_variants)
+        self.assertEqual(upload.call_count, upload_worker.UPLOAD_RETRIES + 1)
+        self.assertIsNone(StoredImage.query.get("new.png"))
+        self.assertEqual([name for name, modified in self.storage.list()], ["old.png"])
+
+
+    def test_deleted_while_uploading(self):
+        """Test a photo whose record was deleted mid-upload is removed from the bucket."""
+
+        log = self.log
+        release_images([log.image_name])
+        db.session.delete(log)
+        db.session.commit()
+
+        queue_upload(app, self.storage, log, self.photo).result(5)
+
+        self.assertEqual([name for name, modified in self.storage.list()], [])
+
+
+    def test_deleted_while_replacing(self):
+        """Test the image a pending photo replaced is released when its record is deleted mid-upload."""
+
+        add_reference("old.png")
+        StoredImage.query.filter_by(name="old.png").update({"uploaded": True})
+        db.session.commit()
+        self.storage.put("old.png", io.BytesIO(b"old image"))
+
+        log = self.log
+        release_images([log.image_name])
+        db.session.delete(log)
+        db.session.commit()
+
+        queue_upload(app, self.storage, log, self.photo, ("old.png", False)).result(5)
+
+        self.assertEqual(StoredImage.query.all(), [])
+        self.assertEqual([name for name, modified in self.storage.list()], [])
+
+
+    def test_already_stored(self):
+        """Test a photo whose bytes are already in the bucket isn't uploaded again."""
+
+        StoredImage.query.filter_by(name="new.png").update({"uploaded": True, "variants": True})
+        db.session.commit()
+
+        with patch.object(self.storage, "put") as upload:
+            queue_upload(app, self.storage, self.log, self.photo).result(5)
+
+        db.session.expire_all()
+        log = Log.query.get(self.log_id)
+        self.assertFalse(log.image_pending)
+        self.assertTrue(log.image_variants)
+        upload.assert_not_called()
+
+
+    def test_same_photo_again(self):
+        """Test giving a record the photo it already has doesn't leave an extra reference."""
+
+        StoredImage.query.filter_by(name="new.png").update({"uploaded": True})
+        add_reference("new.png")
+        db.session.commit()
+
+        queue_upload(app, self.storage, self.log, self.photo, ("new.png", False)).result(5)
+
+        db.session.expire_all()
+        self.assertEqual(StoredImage.query.get("new.png").refs, 1)
+
+
+    def test_staged_upload(self):
+        """Test a photo the browser uploaded itself is renamed by its hash and stored."""
+
+        self.storage.put("old.png", io.BytesIO(b"old image"))
+        self.storage.put("incoming-abc", io.BytesIO(b"image data"))
+        release_images(["new.png"])
+        self.log.image_name = "incoming-abc"
+        db.session.commit()
+
+        queue_upload(app, self.storage, self.log, Staged("incoming-abc", ".PNG", "image/png"), ("old.png", False)).result(5)
+
+        name = f"{hashlib.sha256(b'image data').hexdigest()}.png"
+        db.session.expire_all()
+        log = Log.query.get(self.log_id)
+        self.assertEqual(log.image_name, name)
+        self.assertFalse(log.image_pending)
+        self.assertEqual(StoredImage.query.get(name).refs, 1)
+        self.assertEqual([name for name, modified in self.storage.list()], [name])
+        self.assertEqual(self.storage.get(name), b"image data")
+
+
+    def test_staged_upload_missing(self):
+        """Test the previous image is put back if the browser's upload can't be found."""
+
+        release_images(["new.png"])
+        self.log.image_name = "incoming-abc"
+        db.session.commit()
+
+        queue_upload(app, self.storage, self.log, Staged("incoming-abc", ".png", "image/png"), ("old.png", True)).result(5)
+
+        db.session.expire_all()
+        log = Log.query.get(self.log_id)
+        self.assertEqual(log.image_name, "old.png")
+        self.assertTrue(log.image_variants)
+        self.assertFalse(log.image_pending)
+
+
+    def test_staged_deleted_while_replacing(self):
+        """Test the image a browser-uploaded photo replaced is released when its record is deleted before it's fetched."""
+
+        add_reference("old.png")
+        self.storage.put("old.png", io.BytesIO(b"old image"))
+        self.storage.put("incoming-abc", io.BytesIO(b"image data"))
+        release_images(["new.png"])
+        db.session.delete(self.log)
+        db.session.commit()
+
+        queue_upload(app, self.storage, self.log, Staged("incoming-abc", ".png", "image/png"), ("old.png", False)).result(5)
+
+        self.assertEqual(StoredImage.query.all(), [])
+        self.assertEqual([name for name, modified in self.storage.list()], [])
+
+
+    def test_release_last_reference(self):
+        """Test an image is only released for deletion once nothing uses it."""
+
+        add_reference("new.png")
+        db.session.commit()
+
+        self.assertEqual(release_images(["new.png"]), [])
+        self.assertEqual(release_images(["new.png", "legacy.png", ""]), ["new.png", "legacy.png"])
+        db.session.commit()
+        self.assertIsNone(StoredImage.query.get("new.png"))
+
+
+    def test_read_photo_named_by_hash(self):
+        """Test identical photos get the same name whatever they were called."""
+
+        first = read_photo("IMG_0001.JPG", io.BytesIO(b"image data"), "image/jpeg")
+        second = read_photo("car.jpg", io.BytesIO(b"image data"), "image/jpeg")
+
+        self.assertEqual(first.filename, second.filename)
+        self.assertTrue(first.filename.endswith(".jpg"))
+
+
+    def test_read_photo_too_large(self):
+        """Test photos over the size limit are refused before being queued."""
+
+        with self.assertRaises(UploadTooLarge):
+            read_photo("big.png", io.BytesIO(b"x" * (upload_worker.MAX_UPLOAD_SIZE + 1)), "image/png")
@@ -1,7 +1,9 @@
 """User view tests."""
 
+import hashlib
 import os
 import shutil
+import tempfile
 from io import BytesIO
 from unittest import TestCase
 from flask import url_for
@@ -15,6 +17,8 @@ from app import app, CURR_USER_KEY
 db.create_all()
 
 app.config['WTF_CSRF_ENABLED'] = False
+app.config['STORAGE_BACKEND'] = 'local' # keep uploaded images off S3
+app.config['LOCAL_STORAGE_DIR'] = tempfile.mkdtemp()
 
 class UserViewTestCase(TestCase):
     """Test views for messages."""
@@ -274,7 +278,9 @@ class UserViewTestCase(TestCase):
             self.assertEqual(res.status_code, 200)
             self.assertIn("""<p>I am Mr Turtle</p>""", html)
 
-            user = User.query.filter_by(image_name="new_image.png").all()
+            # uploads are named by a hash of their bytes
+            image_name = f"{hashlib.sha256(b'image data').hexdigest()}.png"
+            user = User.query.filter_by(image_name=image_name).all()
             self.assertEqual(len(user), 1)
 
             data = {
@@ -286,7 +292,7 @@ class UserViewTestCase(TestCase):
 
             res = client.post('/users/edit', content_type="multipart/form-data", data=data, follow_redirects=True)
 
-            user = User.query.filter_by(image_name="new_image.txt").all()
+            user = User.query.filter(User.image_name.like("%.txt")).all()
             self.assertEqual(len(user), 0)
 
 
@@ -0,0 +1,93 @@
+"""Yelp HTTP client tests."""
+
+import os
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from models import db
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+import app  # noqa: F401 - connects db to the test database, which create_all below needs
+
+import yelp_client
+import yelp_governor
+
+db.create_all()
+
+
+def fake_response(status_code):
+    """Build a stand-in for a requests response with the given status."""
+
+    res = MagicMock()
+    res.status_code = status_code
+    return res
+
+
+class YelpClientTestCase(TestCase):
+    """Test the pooled Yelp client."""
+
+    def setUp(self):
+        """Reset latency totals, the breaker and the quota."""
+
+        yelp_client.latency.clear()
+        yelp_governor.reset()
+
+
+    def test_pooled_session(self):
+        """Test Yelp traffic goes through one session with a sized pool."""
+
+        adapter = yelp_client.session.get_adapter(yelp_client.API_BASE_URL)
+        self.assertEqual(adapter._pool_maxsize, yelp_client.POOL_SIZE)
+
+
+    def test_retry_server_error(self):
+        """Test a server error is retried and the eventual response returned."""
+
+        responses = [fake_response(503), fake_response(200)]
+
+        with patch.object(yelp_client.session, "get", side_effect=responses) as get, \
+                patch.object(yelp_client.time, "sleep") as sleep:
+            res = yelp_client.get("KEY", "/search", params={"term": "coffee"})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(get.call_args.kwargs["timeout"], (yelp_client.CONNECT_TIMEOUT, yelp_client.READ_TIMEOUT))
+
+
+    def test_no_retry_client_error(self):
+        """Test a client error such as an unknown business is not retried."""
+
+        with patch.object(yelp_client.session, "get", return_value=fake_response(404)) as get:
+            res = yelp_client.get("KEY", "/unknown-business")
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(get.call_count, 1)
+
+
+    def test_retries_exhausted(self):
+        """Test the connection error is raised once retries run out."""
+
+        with patch.object(yelp_client.session, "get", side_effect=requests.ConnectionError()) as get, \
+                patch.object(yelp_client.time, "sleep"):
+            with self.assertRaises(requests.ConnectionError):
+                yelp_client.get("KEY", "/search")
+
+        self.assertEqual(get.call_count, yelp_client.MAX_RETRIES + 1)
+
+
+    def test_latency_stats(self):
+        """Test every call is counted in the latency totals."""
+
+        with patch.object(yelp_client.session, "get", return_value=fake_response(200)):
+            yelp_client.get("KEY", "/search")
+            yelp_client.get("KEY", "/some-business")
+            yelp_client.get("KEY", "/another-business")
+
+        stats = yelp_client.latency_stats()
+        self.assertEqual(stats["search"]["calls"], 1)
+        self.assertEqual(stats["business"]["calls"], 2)
+        self.assertIn("avg_ms", stats["business"])
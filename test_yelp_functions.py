@@ -0,0 +1,249 @@
+"""Yelp API function tests."""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from business import Business
+from models import db, CachedBusiness
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+import app  # noqa: F401 - connects db to the test database, which create_all below needs
+
+import yelp_client
+import yelp_functions
+import yelp_governor
+from yelp_functions import get_businesses, get_cached_businesses, iter_cached_businesses, business_cache, search_businesses, search_cache
+
+db.create_all()
+
+
+def yelp_business(place_id):
+    """Build Yelp's JSON for a business."""
+
+    return {
+        "id": place_id,
+        "name": place_id.title(),
+        "image_url": f"https://example.com/{place_id}.jpg",
+        "categories": [{"title": "Coffee & Tea"}],
+        "price": "$",
+        "phone": "+13035550100",
+        "location": {"display_address": ["1 Main St", "Denver, CO 80202"]},
+        "url": f"https://www.yelp.com/biz/{place_id}",
+        "rating": 4.5
+    }
+
+
+def fake_response(business):
+    """Build a stand-in for a successful requests response."""
+
+    res = MagicMock()
+    res.status_code = 200
+    res.ok = True
+    res.json.return_value = business
+    return res
+
+
+class YelpFunctionsTestCase(TestCase):
+    """Test Yelp business lookups."""
+
+    def setUp(self):
+        """Reset the breaker and the quota."""
+
+        yelp_governor.reset()
+
+
+    def test_get_businesses_order(self):
+        """Test results come back in the order they were requested."""
+
+        def fake_get(url, **kwargs):
+            place_id = url.rsplit("/", 1)[1]
+            time.sleep(0.05 if place_id == "first" else 0)
+            return fake_response(yelp_business(place_id))
+
+        with patch.object(yelp_client.session, "get", side_effect=fake_get):
+            results = get_businesses("KEY", ["first", "second", "third"])
+
+        self.assertEqual([r.place_id for r in results], ["first", "second", "third"])
+
+
+    def test_get_businesses_partial(self):
+        """Test a failed lookup leaves None without losing the others."""
+
+        def fake_get(url, **kwargs):
+            if url.endswith("/bad"):
+                raise requests.Timeout()
+            return fake_response(yelp_business(url.rsplit("/", 1)[1]))
+
+        with patch.object(yelp_client.session, "get", side_effect=fake_get):
+            results = get_businesses("KEY", ["good", "bad", "also-good"])
+
+        self.assertEqual(results[0].place_id, "good")
+        self.assertIsNone(results[1])
+        self.assertEqual(results[2].place_id, "also-good")
+
+
+    def test_get_businesses_concurrency_cap(self):
+        """Test no more than max_workers lookups are in flight at once."""
+
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def fake_get(url, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+            return fake_response(yelp_business(url.rsplit("/", 1)[1]))
+
+        with patch.object(yelp_client.session, "get", side_effect=fake_get):
+            results = get_businesses("KEY", [str(i) for i in range(12)], max_workers=3)
+
+        self.assertEqual(len(results), 12)
+        self.assertLessEqual(peak[0], 3)
+
+
+    def test_get_businesses_empty(self):
+        """Test no lookups are made for a user without places."""
+
+        self.assertEqual(get_businesses("KEY", []), [])
+
+
+class SearchCacheTestCase(TestCase):
+    """Test the /search result cache."""
+
+    def setUp(self):
+        """Empty the search cache."""
+
+        search_cache.clear()
+        yelp_governor.reset()
+
+
+    def test_equivalent_searches_share_entry(self):
+        """Test searches differing only in case and spacing call Yelp once."""
+
+        res = fake_response({"businesses": [yelp_business("cafe")]})
+
+        with patch.object(yelp_client.session, "get", return_value=res) as fetch:
+            first = search_businesses("KEY", "Coffee", "Denver, CO")
+            second = search_businesses("KEY", "  coffee ", "denver,  co")
+
+        self.assertEqual(first, second)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(fetch.call_args.kwargs["params"], {"term": "coffee", "location": "denver, co"})
+
+
+    def test_errors_not_cached(self):
+        """Test an error response from Yelp is passed on but not cached."""
+
+        res = fake_response({"error": {"code": "LOCATION_NOT_FOUND"}})
+        res.status_code = 400
+        res.ok = False
+
+        with patch.object(yelp_client.session, "get", return_value=res) as fetch:
+            search_businesses("KEY", "coffee", "nowhere")
+            search_businesses("KEY", "coffee", "nowhere")
+
+        self.assertEqual(fetch.call_count, 2)
+
+
+class BusinessCacheTestCase(TestCase):
+    """Test the two-tier business detail cache."""
+
+    def setUp(self):
+        """Empty both cache tiers."""
+
+        CachedBusiness.query.delete()
+        db.session.commit()
+        business_cache.clear()
+        yelp_governor.reset()
+
+
+    def tearDown(self):
+        """Clean up after tests."""
+
+        db.session.rollback()
+        business_cache.clear()
+
+
+    def test_fetch_then_cache(self):
+        """Test a business is only requested from Yelp once."""
+
+        with patch.object(yelp_client.session, "get", return_value=fake_response(yelp_business("cafe"))) as fetch:
+            first = get_cached_businesses("KEY", ["cafe"])
+            second = get_cached_businesses("KEY", ["cafe"])
+
+        self.assertEqual(first, second)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(CachedBusiness.query.get("cafe").data, Business.from_yelp(yelp_business("cafe")).to_dict())
+
+
+    def test_shared_tier(self):
+        """Test another worker's cached copy is used before calling Yelp."""
+
+        diner = Business.from_yelp(yelp_business("diner"))
+        db.session.add(CachedBusiness(id="diner", data=diner.to_dict(), fetched_at=datetime.utcnow()))
+        db.session.commit()
+
+        with patch.object(yelp_client.session, "get") as fetch:
+            results = get_cached_businesses("KEY", ["diner"])
+
+        self.assertEqual(results, [diner])
+        fetch.assert_not_called()
+        self.assertEqual(business_cache.get("diner"), diner)
+
+
+    def test_shared_tier_raw_yelp_rows(self):
+        """Test rows cached as Yelp's JSON are still read, and unreadable ones refetched."""
+
+        db.session.add(CachedBusiness(id="diner", data=yelp_business("diner"), fetched_at=datetime.utcnow()))
+        db.session.add(CachedBusiness(id="cafe", data={"id": "cafe"}, fetched_at=datetime.utcnow()))
+        db.session.commit()
+
+        with patch.object(yelp_client.session, "get", return_value=fake_response(yelp_business("cafe"))) as fetch:
+            results = get_cached_businesses("KEY", ["diner", "cafe"])
+
+        self.assertEqual([r.place_id for r in results], ["diner", "cafe"])
+        self.assertEqual(fetch.call_count, 1)
+
+
+    def test_stale_shared_rows(self):
+        """Test rows older than the TTL are refetched and replaced."""
+
+        stale = datetime.utcnow() - timedelta(seconds=yelp_functions.BUSINESS_CACHE_TTL + 60)
+        db.session.add(CachedBusiness(id="diner", data={"id": "diner", "old": True}, fetched_at=stale))
+        db.session.commit()
+
+        with patch.object(yelp_client.session, "get", return_value=fake_response(yelp_business("diner"))) as fetch:
+            results = get_cached_businesses("KEY", ["diner"])
+
+        self.assertEqual(results, [Business.from_yelp(yelp_business("diner"))])
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(CachedBusiness.query.get("diner").data["place_id"], "diner")
+
+
+    def test_iter_mixes_cached_and_fetched(self):
+        """Test cached and fetched businesses are yielded in the requested order."""
+
+        cafe = Business.from_yelp(yelp_business("cafe"))
+        business_cache.set("cafe", cafe)
+
+        with patch.object(yelp_client.session, "get", return_value=fake_response(yelp_business("diner"))):
+            results = list(iter_cached_businesses("KEY", ["diner", "cafe"]))
+
+        self.assertEqual(results, [("diner", Business.from_yelp(yelp_business("diner"))), ("cafe", cafe)])
+
+
+    def test_ttl_cap(self):
+        """Test the cache never keeps Yelp data for more than 24 hours."""
+
+        self.assertLessEqual(yelp_functions.BUSINESS_CACHE_TTL, 24 * 60 * 60)
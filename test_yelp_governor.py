@@ -0,0 +1,186 @@
+"""Yelp quota and circuit breaker tests."""
+
+import os
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from models import db, CachedBusiness
+
+os.environ['DATABASE_URL'] = "postgresql:///greenflash-test"
+
+from app import app
+
+import yelp_client
+import yelp_functions
+import yelp_governor
+from yelp_governor import CircuitBreaker, YelpUnavailable
+
+db.create_all()
+
+
+def fake_response(body, status_code=200):
+    """Build a stand-in for a requests response."""
+
+    res = MagicMock()
+    res.status_code = status_code
+    res.ok = status_code < 400
+    res.json.return_value = body
+    return res
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Test the breaker's state changes."""
+
+    def test_opens_after_failures(self):
+        """Test the breaker opens after enough consecutive failures."""
+
+        breaker = CircuitBreaker(failures=3, cooldown=60)
+        for _ in range(2):
+            breaker.record(False)
+        self.assertTrue(breaker.allow())
+
+        breaker.record(False)
+        self.assertEqual(breaker.status()["state"], "open")
+        self.assertFalse(breaker.allow())
+
+
+    def test_success_resets_count(self):
+        """Test a success in between failures keeps the breaker closed."""
+
+        breaker = CircuitBreaker(failures=2, cooldown=60)
+        breaker.record(False)
+        breaker.record(True)
+        breaker.record(False)
+
+        self.assertEqual(breaker.status()["state"], "closed")
+
+
+    def test_half_open_trial(self):
+        """Test one trial call is let through after the cooldown."""
+
+        breaker = CircuitBreaker(failures=1, cooldown=0.01)
+        breaker.record(False)
+        time.sleep(0.02)
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        breaker.record(True)
+        self.assertEqual(breaker.status()["state"], "closed")
+
+
+class GovernorTestCase(TestCase):
+    """Test the shared quota and stale fallbacks."""
+
+    def setUp(self):
+        """Reset the breaker, quota and caches."""
+
+        yelp_governor.reset()
+        yelp_functions.search_cache.clear()
+        yelp_functions.business_cache.clear()
+        CachedBusiness.query.delete()
+        db.session.commit()
+
+
+    def tearDown(self):
+        """Clean up after tests."""
+
+        db.session.rollback()
+        yelp_governor.reset()
+
+
+    def test_quota_exhausted(self):
+        """Test Yelp isn't called once the quota is spent."""
+
+        with patch.object(yelp_governor, "QUOTA_BURST", 2), \
+                patch.object(yelp_client.session, "get", return_value=fake_response({})) as get:
+            yelp_client.get("KEY", "/one")
+            yelp_client.get("KEY", "/two")
+            with self.assertRaises(YelpUnavailable):
+                yelp_client.get("KEY", "/three")
+
+            self.assertEqual(get.call_count, 2)
+            self.assertEqual(yelp_governor.quota_status()["remaining"], 0)
+
+
+    def test_slow_calls_open_breaker(self):
+        """Test calls slower than SLOW_CALL count as failures."""
+
+        with patch.object(yelp_governor, "SLOW_CALL", -1), \
+                patch.object(yelp_client.session, "get", return_value=fake_response({})):
+            for _ in range(yelp_governor.BREAKER_FAILURES):
+                yelp_client.get("KEY", "/slow")
+
+            with self.assertRaises(YelpUnavailable):
+                yelp_client.get("KEY", "/slow")
+
+
+    def test_stale_search_while_open(self):
+        """Test an expired search is served without waiting while the breaker is open."""
+
+        key = yelp_functions.search_key("coffee", "Denver, CO")
+        yelp_functions.search_cache.set(key, {"businesses": []}, ttl=0.01)
+        time.sleep(0.02)
+
+        for _ in range(yelp_governor.BREAKER_FAILURES):
+            yelp_governor.breaker.record(False)
+
+        with patch.object(yelp_client.session, "get") as get:
+            resp = yelp_functions.search_businesses("KEY", "coffee", "Denver, CO")
+
+        self.assertEqual(resp, {"businesses": []})
+        get.assert_not_called()
+
+
+    def test_search_unavailable(self):
+        """Test /search answers 503 straight away when there is nothing to fall back on."""
+
+        for _ in range(yelp_governor.BREAKER_FAILURES):
+            yelp_governor.breaker.record(False)
+
+        res = app.test_client().post('/search', json={"category": "coffee", "city": "Nowhere"})
+
+        self.assertEqual(res.status_code, 503)
+
+
+    def test_stale_business_fallback(self):
+        """Test an expired shared copy is used when Yelp is unavailable."""
+
+        fetched_at = datetime.utcnow() - timedelta(seconds=yelp_functions.BUSINESS_CACHE_TTL + 60)
+        diner = {"place_id": "diner", "name": "Diner", "image_url": "", "category": "Diners", "price": "$", "phone": "",
+            "address_0": "1 Main St", "address_1": "Denver, CO 80202", "url": "", "rating": "static/images/stars/regular_4.png"}
+        db.session.add(CachedBusiness(id="diner", data=diner, fetched_at=fetched_at))
+        db.session.commit()
+
+        for _ in range(yelp_governor.BREAKER_FAILURES):
+            yelp_governor.breaker.record(False)
+
+        results = yelp_functions.get_cached_businesses("KEY", ["diner", "unknown"])
+
+        self.assertEqual(results[0].to_dict(), diner)
+        self.assertIsNone(results[1])
+
+
+    def test_status_route(self):
+        """Test operators can see the breaker and remaining quota."""
+
+        with patch.dict(app.config, {"STATUS_TOKEN": "operator"}):
+            res = app.test_client().get('/status/yelp', headers={"Authorization": "Bearer operator"})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json["breaker"]["state"], "closed")
+        self.assertEqual(res.json["quota"]["remaining"], yelp_governor.QUOTA_BURST)
+        self.assertIn("hits", res.json["business_cache"]["local"])
+
+
+    def test_status_route_hidden(self):
+        """Test the status route is hidden without the operator token, or while none is configured."""
+
+        client = app.test_client()
+        with patch.dict(app.config, {"STATUS_TOKEN": "operator"}):
+            self.assertEqual(client.get('/status/yelp').status_code, 404)
+            self.assertEqual(client.get('/status/yelp', headers={"Authorization": "Bearer wrong"}).status_code, 404)
+        with patch.dict(app.config, {"STATUS_TOKEN": None}):
+            self.assertEqual(client.get('/status/yelp', headers={"Authorization": "Bearer "}).status_code, 404)
@@ -0,0 +1,78 @@
+"""Yelp stand-in server tests."""
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+import yelp_standin
+from yelp_standin import create_app
+
+
+class YelpStandinTestCase(TestCase):
+    """Test replaying, recording and error injection."""
+
+    def setUp(self):
+        """Create a stand-in serving the bundled cassette."""
+
+        self.client = create_app().test_client()
+
+
+    def test_replay_business(self):
+        """Test a recorded business is served."""
+
+        res = self.client.get("/v3/businesses/denver-roasters-denver")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json["name"], "Denver Roasters")
+
+
+    def test_unknown_business(self):
+        """Test an unrecorded business is a Yelp style 404."""
+
+        res = self.client.get("/v3/businesses/not-a-real-place")
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.json["error"]["code"], "BUSINESS_NOT_FOUND")
+
+
+    def test_replay_search(self):
+        """Test a recorded search is served regardless of case and spacing."""
+
+        res = self.client.get("/v3/businesses/search", query_string={"term": "Coffee", "location": "Denver,  CO"})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json["businesses"]), 2)
+
+
+    def test_error_injection(self):
+        """Test injected errors use the configured status."""
+
+        client = create_app(error_rate=1.0, error_status=429).test_client()
+        res = client.get("/v3/businesses/denver-roasters-denver")
+
+        self.assertEqual(res.status_code, 429)
+
+
+    def test_record(self):
+        """Test record mode saves unrecorded responses to the cassette."""
+
+        upstream = MagicMock()
+        upstream.ok = True
+        upstream.json.return_value = {"id": "new-place", "name": "New Place"}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cassette_path = os.path.join(tmp, "cassette.json")
+            client = create_app(cassette_path=cassette_path, record=True, api_key="KEY").test_client()
+
+            with patch.object(yelp_standin.requests, "get", return_value=upstream) as get:
+                first = client.get("/v3/businesses/new-place")
+                second = client.get("/v3/businesses/new-place")
+
+            with open(cassette_path) as f:
+                cassette = json.load(f)
+
+        self.assertEqual(first.json, second.json)
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(cassette["businesses"]["new-place"]["name"], "New Place")
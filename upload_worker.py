@@ -0,0 +1,277 @@
+"""Background uploads and deletes of user images, so requests don't wait on storage.
+
+A request reads the photo into memory, saves its record with image_pending set and queues the upload. A worker thread uploads the photo and resized WebP variants of it, retrying failures, then clears image_pending, or puts back the record's previous image if the upload never succeeds. The image a new photo replaces is only released once the new one is safely stored.
+
+Photos are named by a hash of their bytes, and a stored_images row counts the records using each one. Identical photos are uploaded once, and an image is only deleted from storage when its last reference is released.
+
+A browser can also upload a photo straight to storage under a random "incoming-" name, so no request has to wait on the transfer. The record points at that name until a worker fetches the photo, names it by its hash and carries on as above.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from image_variants import VARIANTS, make_variants, variant_name
+from sqlalchemy.dialects.postgresql import insert
+from models import db, StoredImage
+from s3_functions import UploadTooLarge, MAX_UPLOAD_SIZE
+
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 2)) # threads uploading per worker
+MAX_PENDING_UPLOADS = int(os.environ.get('MAX_PENDING_UPLOADS', 8)) # photos held in memory at once, including those uploading
+UPLOAD_RETRIES = int(os.environ.get('UPLOAD_RETRIES', 3))
+UPLOAD_RETRY_BACKOFF = 1 # seconds, doubled on each retry
+
+logger = logging.getLogger(__name__)
+
+upload_pool = ThreadPoolExecutor(UPLOAD_WORKERS)
+pending_slots = threading.BoundedSemaphore(MAX_PENDING_UPLOADS)
+
+Photo = namedtuple("Photo", ["filename", "data", "content_type"])
+Staged = namedtuple("Staged", ["filename", "extension", "content_type"]) # a photo the browser uploaded to storage itself
+
+
+def read_photo(filename, stream, content_type):
+    """Read an uploaded photo into memory, naming it by the SHA-256 of its bytes and the extension of filename.
+
+    Raises UploadTooLarge if it is over MAX_UPLOAD_SIZE.
+    """
+
+    data = stream.read(MAX_UPLOAD_SIZE + 1)
+    if len(data) > MAX_UPLOAD_SIZE:
+        raise UploadTooLarge(f"Upload is larger than {MAX_UPLOAD_SIZE} bytes.")
+
+    return hashed_photo(data, os.path.splitext(filename)[1], content_type)
+
+
+def hashed_photo(data, extension, content_type):
+    """Return a Photo of data named by its SHA-256 and extension"""
+
+    return Photo(f"{hashlib.sha256(data).hexdigest()}{extension.lower()}", data, content_type)
+
+
+def add_reference(name):
+    """Count a new use of the image name, in the current transaction. Return its stored_images row."""
+
+    stmt = insert(StoredImage).values(name=name, refs=1)
+    stmt = stmt.on_conflict_do_update(index_elements=[StoredImage.name], set_={"refs": StoredImage.refs + 1})
+    db.session.execute(stmt)
+    return StoredImage.query.populate_existing().get(name)
+
+
+def release_images(names):
+    """Drop one reference for each of names, in the current transaction.
+
+    Returns the images nothing uses any more, to be deleted from storage once the transaction commits. Images uploaded before names were hashed have no row, and are returned straight away.
+    """
+
+    released = []
+    for name, count in Counter(name for name in names if name).items():
+        refs = db.session.execute(
+            db.update(StoredImage).where(StoredImage.name == name).values(refs=StoredImage.refs - count).returning(StoredImage.refs)
+        ).scalar()
+        if refs is not None and refs > 0:
+            continue
+        if refs is not None:
+            db.session.execute(db.delete(StoredImage).where(StoredImage.name == name, StoredImage.refs <= 0))
+        released.append(name)
+
+    return released
+
+
+def queue_upload(app, storage, record, photo, previous=(None, False)):
+    """Upload photo for record in the background.
+
+    photo is a Photo, or a Staged photo already in storage. record must already be committed with image_name set to photo.filename and image_pending set. previous is the (image_name, image_variants) of the image it replaces, if any. Blocks while MAX_PENDING_UPLOADS photos are already waiting, so a burst of uploads can't use unbounded memory.
+    """
+
+    run = run_staged if isinstance(photo, Staged) else run_upload
+    pending_slots.acquire()
+    try:
+        return upload_pool.submit(run, app, storage, type(record), record.id, photo, previous)
+    except BaseException:
+        pending_slots.release()
+        raise
+
+
+def queue_delete(storage, images):
+    """Delete images from storage in the background"""
+
+    return upload_pool.submit(run_delete, storage, images)
+
+
+def upload_with_retries(storage, photo):
+    """Upload photo, retrying failures. Return whether it was uploaded."""
+
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            storage.put(photo.filename, io.BytesIO(photo.data), content_type=photo.content_type)
+            return True
+        except storage.errors as e:
+            logger.warning("upload of %s failed (attempt %d): %s", photo.filename, attempt + 1, e)
+            if attempt < UPLOAD_RETRIES:
+                time.sleep(UPLOAD_RETRY_BACKOFF * 2 ** attempt)
+    return False
+
+
+def upload_variants(storage, photo):
+    """Make and upload the resized variants of photo. Return their widths by variant name if they all were uploaded, otherwise None."""
+
+    try:
+        variants = make_variants(photo.data)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("could not resize %s: %s", photo.filename, e)
+        return None
+
+    if not all([
+        upload_with_retries(storage, Photo(variant_name(photo.filename, variant), data, "image/webp"))
+        for variant, (data, width) in variants.items()
+    ]):
+        return None
+    return {variant: width for variant, (data, width) in variants.items()}
+
+
+def run_upload(app, storage, model, record_id, photo, previous):
+    """Upload a queued photo and its variants unless they are already stored, then mark its record ready"""
+
+    previous_name = previous[0]
+    settled = False
+    try:
+        with app.app_context():
+            stored = StoredImage.query.get(photo.filename)
+            uploaded = stored is not None and stored.uploaded
+            has_variants = uploaded and stored.variants
+            widths = stored.variant_widths if uploaded else None
+
+        if not uploaded:
+            uploaded = upload_with_retries(storage, photo)
+            widths = upload_variants(storage, photo) if uploaded else None
+            has_variants = widths is not None
+
+        with app.app_context():
+            if uploaded:
+                StoredImage.query.filter_by(name=photo.filename).update({"uploaded": True, "variants": has_variants, "variant_widths": widths})
+
+            record = model.query.get(record_id)
+            if record is None or record.image_name != photo.filename:
+                # deleted or given another photo while uploading, which released this one but not the image it replaced
+                released = release_images([previous_name])
+                released += [photo.filename] if StoredImage.query.get(photo.filename) is None else []
+                db.session.commit()
+            elif uploaded:
+                record.image_pending = False
+                record.image_variants = has_variants
+                released = release_images([previous_name]) # only drops the extra reference if it was the same photo
+                db.session.commit()
+            else:
+                logger.error("giving up on upload of %s for %s %s", photo.filename, model.__name__, record_id)
+                released = restore_previous(record, photo, previous)
+                db.session.commit()
+        settled = True
+
+        run_delete(storage, released)
+    finally:
+        try:
+            if not settled:
+                settle_upload(app, storage, model, record_id, photo, previous)
+        finally:
+            pending_slots.release()
+
+
+def restore_previous(record, photo, previous):
+    """Put back the image record had before photo, in the current transaction. Return the images to delete once it commits."""
+
+    record.image_name, record.image_variants = previous
+    record.image_pending = False
+    return release_images([photo.filename])
+
+
+def settle_upload(app, storage, model, record_id, photo, previous):
+    """Clear image_pending on a record whose upload stopped on an unexpected error, so it isn't left pending forever.
+
+    The photo is kept if it was stored, otherwise the previous image is put back.
+    """
+
+    logger.error("upload of %s for %s %s failed unexpectedly", photo.filename, model.__name__, record_id)
+    with app.app_context():
+        record = model.query.get(record_id)
+        if record is not None and record.image_name == photo.filename and not record.image_pending:
+            return # settled before the error
+
+        stored = StoredImage.query.get(photo.filename)
+        if record is None or record.image_name != photo.filename:
+            released = release_images([previous[0]]) # as in run_upload, the image photo replaced is no longer anyone's
+            released += [photo.filename] if stored is None else []
+        elif stored is not None and stored.uploaded:
+            record.image_pending = False
+            record.image_variants = stored.variants
+            released = release_images([previous[0]])
+        else:
+            released = restore_previous(record, photo, previous)
+        db.session.commit()
+
+    run_delete(storage, released)
+
+
+def run_staged(app, storage, model, record_id, staged, previous):
+    """Fetch a photo the browser uploaded, point its record at the photo's hashed name, then upload it as run_upload does"""
+
+    previous_name, previous_variants = previous
+    photo = None
+    try:
+        try:
+            photo = hashed_photo(storage.get(staged.filename), staged.extension, staged.content_type)
+        except storage.errors + (UploadTooLarge,) as e:
+            logger.warning("could not fetch uploaded %s: %s", staged.filename, e)
+
+        with app.app_context():
+            record = model.query.get(record_id)
+            released = []
+            if record is None or record.image_name != staged.filename:
+                # deleted or given another photo while waiting, which released this one but not the image it replaced
+                photo = None
+                released = release_images([previous_name])
+            elif photo is None:
+                logger.error("giving up on upload of %s for %s %s", staged.filename, model.__name__, record_id)
+                record.image_name = previous_name
+                record.image_variants = previous_variants
+                record.image_pending = False
+            else:
+                add_reference(photo.filename)
+                record.image_name = photo.filename
+            db.session.commit()
+        run_delete(storage, released)
+
+        try:
+            storage.delete(staged.filename)
+        except storage.errors as e:
+            logger.warning("could not delete %s: %s", staged.filename, e)
+    except BaseException:
+        pending_slots.release()
+        raise
+
+    if photo is None:
+        pending_slots.release()
+    else:
+        run_upload(app, storage, model, record_id, photo, previous) # releases the slot
+
+
+def run_delete(storage, images):
+    """Delete images and their variants from storage, logging any that couldn't be"""
+
+    images = [image for image in images if image]
+    if not images:
+        return
+    images += [variant_name(image, variant) for image in images for variant in VARIANTS]
+    try:
+        failed = storage.delete_many(images)
+    except storage.errors as e:
+        logger.error("could not delete %s: %s", images, e)
+        return
+
+    for failure in failed:
+        logger.warning("could not delete %s: %s %s", failure["Key"], failure["Code"], failure["Message"])
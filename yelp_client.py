@@ -0,0 +1,90 @@
+import logging
+import os
+import random
+import threading
+import time
+import requests
+import yelp_governor
+from requests.adapters import HTTPAdapter
+
+API_BASE_URL = os.environ.get('YELP_API_BASE_URL', "https://api.yelp.com/v3/businesses") # can point at yelp_standin.py for load tests
+POOL_SIZE = int(os.environ.get('YELP_POOL_SIZE', 16)) # kept-alive connections to Yelp per worker
+CONNECT_TIMEOUT = float(os.environ.get('YELP_CONNECT_TIMEOUT', 3.05)) # seconds
+READ_TIMEOUT = float(os.environ.get('YELP_READ_TIMEOUT', 5)) # seconds
+MAX_RETRIES = int(os.environ.get('YELP_MAX_RETRIES', 2))
+RETRY_BACKOFF = 0.25 # seconds, doubled on each retry before jitter is applied
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+latency = {}
+latency_lock = threading.Lock()
+
+
+def make_session():
+    """Create a session that reuses its connections to Yelp between requests"""
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = make_session()
+
+
+def get(api_key, path, params=None):
+    """GET a path under the Yelp businesses API.
+
+    Connection errors, timeouts and throttled or server error responses are retried up to MAX_RETRIES times, sleeping a random, exponentially growing backoff between attempts so workers don't retry in lockstep. The last response is returned whatever its status, and the last connection error is raised.
+
+    Every attempt spends one call from the shared quota and reports to the circuit breaker. yelp_governor.YelpUnavailable is raised straight away, without calling Yelp, while the breaker is open or the quota is spent.
+    """
+
+    headers = {'Authorization' : f'Bearer {api_key}'}
+    endpoint = "search" if path == "/search" else "business"
+
+    for attempt in range(MAX_RETRIES + 1):
+        yelp_governor.before_call()
+        start = time.perf_counter()
+        try:
+            res = session.get(f"{API_BASE_URL}{path}", headers=headers, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        except (requests.ConnectionError, requests.Timeout):
+            elapsed = time.perf_counter() - start
+            record_latency(endpoint, elapsed, "error")
+            yelp_governor.after_call(False, elapsed)
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            elapsed = time.perf_counter() - start
+            record_latency(endpoint, elapsed, res.status_code)
+            yelp_governor.after_call(res.status_code not in RETRY_STATUSES, elapsed)
+            if res.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return res
+
+        time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+
+def record_latency(endpoint, seconds, status):
+    """Log how long a single call to Yelp took and add it to the running totals"""
+
+    logger.info("yelp %s %s %.1fms", endpoint, status, seconds * 1000)
+
+    with latency_lock:
+        stats = latency.setdefault(endpoint, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats["total_ms"] += seconds * 1000
+        stats["max_ms"] = max(stats["max_ms"], seconds * 1000)
+        if status == "error" or status in RETRY_STATUSES:
+            stats["errors"] += 1
+
+
+def latency_stats():
+    """Return call counts and average/max latency for each kind of Yelp call"""
+
+    with latency_lock:
+        return {
+            endpoint: dict(stats, avg_ms=stats["total_ms"] / stats["calls"])
+            for endpoint, stats in latency.items()
+        }
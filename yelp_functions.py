@@ -0,0 +1,262 @@
+import os
+import requests
+import yelp_client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert
+from business import Business
+from cache import TTLCache, SingleFlight
+from models import db, CachedBusiness
+
+MAX_CONCURRENT_REQUESTS = 8 # cap on simultaneous Yelp lookups for a single page request
+
+# Yelp's terms do not allow storing their data for more than 24 hours
+MAX_BUSINESS_CACHE_TTL = 24 * 60 * 60
+BUSINESS_CACHE_TTL = min(int(os.environ.get('BUSINESS_CACHE_TTL', 6 * 60 * 60)), MAX_BUSINESS_CACHE_TTL)
+BUSINESS_CACHE_SIZE = int(os.environ.get('BUSINESS_CACHE_SIZE', 2000))
+
+SEARCH_CACHE_TTL = min(int(os.environ.get('SEARCH_CACHE_TTL', 5 * 60)), MAX_BUSINESS_CACHE_TTL)
+SEARCH_STALE_TTL = min(int(os.environ.get('SEARCH_STALE_TTL', 60 * 60)), MAX_BUSINESS_CACHE_TTL - SEARCH_CACHE_TTL)
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 500))
+
+# expired entries may be served while Yelp is unavailable, but never once they are 24 hours old
+business_cache = TTLCache(maxsize=BUSINESS_CACHE_SIZE, ttl=BUSINESS_CACHE_TTL, stale_ttl=MAX_BUSINESS_CACHE_TTL - BUSINESS_CACHE_TTL)
+shared_cache_counts = {"hits": 0, "misses": 0}
+search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_STALE_TTL)
+search_flight = SingleFlight()
+background_pool = ThreadPoolExecutor(max_workers=2) # refreshes and prefetches that no request waits on
+
+
+def search_key(term, location):
+    """Normalize a search so equivalent queries share a cache entry"""
+
+    return (" ".join(term.lower().split()), " ".join(location.lower().split()))
+
+
+def search_businesses(api_key, term, location):
+    """Search Yelp for businesses matching term near location.
+
+    Results are cached briefly by normalized (term, location). If several requests miss on the same search at once, only one of them calls Yelp and the rest share its response. A recently expired result is returned straight away while a fresh one is fetched in the background.
+
+    Raises requests.RequestException if Yelp can't be reached and there is no cached result to fall back on.
+    """
+
+    key = search_key(term, location)
+    resp = search_cache.get(key)
+    if resp is not None:
+        return resp
+
+    resp = search_cache.get_stale(key)
+    if resp is not None:
+        background_pool.submit(revalidate_search, api_key, key)
+        return resp
+
+    return search_flight.do(key, lambda: fetch_search(api_key, key))
+
+
+def revalidate_search(api_key, key):
+    """Refresh an expired search in the background, keeping the stale copy if Yelp is unavailable"""
+
+    try:
+        search_flight.do(key, lambda: fetch_search(api_key, key))
+    except requests.RequestException:
+        pass
+
+
+def fetch_search(api_key, key):
+    """Request a normalized search from Yelp, caching successful responses.
+
+    A successful response is returned as {"businesses": [Business, ...]}, leaving out any business too incomplete to display. Yelp's error responses are returned as they are.
+    """
+
+    resp = search_cache.get(key) # another request may have just filled it
+    if resp is not None:
+        return resp
+
+    term, location = key
+    res = yelp_client.get(api_key, "/search", params={'term' : term, 'location' : location})
+    resp = res.json()
+    if not res.ok:
+        return resp
+
+    businesses = []
+    for data in resp.get("businesses", []):
+        try:
+            businesses.append(Business.from_yelp(data))
+        except (KeyError, IndexError):
+            continue # too incomplete to display
+
+    resp = {"businesses": businesses}
+    search_cache.set(key, resp)
+    return resp
+
+
+def get_business(api_key, place_id):
+    """Request the details of a single business by its Yelp ID, returning a Business"""
+
+    res = yelp_client.get(api_key, f"/{place_id}")
+    res.raise_for_status()
+    return Business.from_yelp(res.json())
+
+
+def iter_businesses(api_key, place_ids, max_workers=MAX_CONCURRENT_REQUESTS):
+    """Request the details of many businesses in parallel.
+
+    Lookups run on a thread pool of at most max_workers threads. Yields (place_id, business) pairs in the same order as place_ids, each as soon as it and the ones before it have finished. A lookup that fails, times out or returns a business too incomplete to display yields None, so the rest of the results can still be used.
+    """
+
+    if not place_ids:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(place_ids)))
+    futures = [executor.submit(get_business, api_key, place_id) for place_id in place_ids]
+
+    try:
+        for place_id, future in zip(place_ids, futures):
+            try:
+                business = future.result()
+            except (requests.RequestException, ValueError, KeyError, IndexError):
+                business = None
+            yield place_id, business
+    finally:
+        for future in futures:
+            future.cancel() # only stops lookups that haven't started, if the caller gave up early
+        executor.shutdown(wait=False)
+
+
+def get_businesses(api_key, place_ids, max_workers=MAX_CONCURRENT_REQUESTS):
+    """Request the details of many businesses in parallel, returning them in the order of place_ids"""
+
+    return [business for _, business in iter_businesses(api_key, place_ids, max_workers)]
+
+
+def iter_cached_businesses(api_key, place_ids):
+    """Yield (place_id, business) for many businesses, using cached copies where possible.
+
+    Each ID is looked up in this worker's cache first, then in the cached_businesses table shared by all workers, and only then fetched from Yelp. If Yelp can't be reached, or the circuit breaker is open, an expired copy is used instead as long as it is less than 24 hours old. Pairs are yielded in the order of place_ids as soon as they are ready, with None for businesses that could not be loaded. Freshly fetched businesses are written to both caches once all have been yielded.
+    """
+
+    found = {}
+    stale = {}
+    for place_id in place_ids:
+        business = business_cache.get(place_id)
+        if business is not None:
+            found[place_id] = business
+            continue
+
+        business = business_cache.get_stale(place_id)
+        if business is not None:
+            stale[place_id] = business
+
+    missing = [place_id for place_id in place_ids if place_id not in found]
+    if missing:
+        fresh, stale_rows = load_shared_businesses(missing)
+        found.update(fresh)
+        stale = dict(stale_rows, **stale)
+
+    missing = [place_id for place_id in place_ids if place_id not in found]
+    lookups = iter_businesses(api_key, missing)
+    fetched = {}
+
+    try:
+        for place_id in place_ids:
+            if place_id in found:
+                yield place_id, found[place_id]
+                continue
+
+            _, business = next(lookups) # lookups come back in the same order as missing
+            if business is not None:
+                fetched[place_id] = business
+            else:
+                business = stale.get(place_id)
+            yield place_id, business
+    finally:
+        lookups.close()
+
+    store_businesses(fetched)
+
+
+def get_cached_businesses(api_key, place_ids):
+    """Request the details of many businesses, using cached copies where possible.
+
+    Results are in the same order as place_ids, with None for businesses that could not be loaded.
+    """
+
+    return [business for _, business in iter_cached_businesses(api_key, place_ids)]
+
+
+def prefetch_businesses(app, api_key, place_ids):
+    """Warm both business caches with place_ids in the background, so a later request finds them cached"""
+
+    def prefetch():
+        with app.app_context():
+            get_cached_businesses(api_key, place_ids)
+
+    return background_pool.submit(prefetch)
+
+
+def load_shared_businesses(place_ids):
+    """Load businesses from the shared cache table.
+
+    Returns a dict of fresh businesses, which are also added to this worker's cache, and a dict of expired ones that are still less than 24 hours old.
+    """
+
+    now = datetime.utcnow()
+    rows = CachedBusiness.query.filter(
+        CachedBusiness.id.in_(place_ids),
+        CachedBusiness.fetched_at > now - timedelta(seconds=MAX_BUSINESS_CACHE_TTL)).all()
+
+    found = {}
+    stale = {}
+    for row in rows:
+        try:
+            business = Business.from_cache(row.data)
+        except (KeyError, IndexError, TypeError):
+            continue # unreadable, treat as missing
+
+        remaining = BUSINESS_CACHE_TTL - (now - row.fetched_at).total_seconds()
+        if remaining > 0:
+            business_cache.set(row.id, business, ttl=remaining)
+            found[row.id] = business
+        else:
+            stale[row.id] = business
+
+    shared_cache_counts["hits"] += len(found)
+    shared_cache_counts["misses"] += len(place_ids) - len(found)
+    return found, stale
+
+
+def store_businesses(businesses):
+    """Save fetched businesses to both caches, and purge shared rows older than 24 hours"""
+
+    if not businesses:
+        return
+
+    now = datetime.utcnow()
+    for place_id, business in businesses.items():
+        business_cache.set(place_id, business)
+
+    rows = [{"id": place_id, "data": business.to_dict(), "fetched_at": now} for place_id, business in businesses.items()]
+    stmt = insert(CachedBusiness).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CachedBusiness.id],
+        set_={"data": stmt.excluded.data, "fetched_at": stmt.excluded.fetched_at})
+    db.session.execute(stmt)
+    CachedBusiness.query.filter(CachedBusiness.fetched_at <= now - timedelta(seconds=MAX_BUSINESS_CACHE_TTL)).delete()
+    db.session.commit()
+
+
+def business_cache_stats():
+    """Return hit/miss/eviction counters for both tiers of the business cache"""
+
+    return {
+        "local": business_cache.stats(),
+        "shared": dict(shared_cache_counts),
+        "ttl": BUSINESS_CACHE_TTL
+    }
+
+
+def search_cache_stats():
+    """Return hit/miss/eviction counters for the search cache"""
+
+    return dict(search_cache.stats(), ttl=SEARCH_CACHE_TTL)
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+import requests
+from sqlalchemy import text
+from models import db
+
+DAILY_QUOTA = int(os.environ.get('YELP_DAILY_QUOTA', 5000)) # calls per day allowed by our Yelp plan
+QUOTA_BURST = int(os.environ.get('YELP_QUOTA_BURST', DAILY_QUOTA // 10)) # calls that may be made at once after a quiet spell
+QUOTA_RATE = DAILY_QUOTA / (24 * 60 * 60) # calls earned per second
+
+BREAKER_FAILURES = int(os.environ.get('YELP_BREAKER_FAILURES', 5)) # consecutive failed or slow calls that open the breaker
+BREAKER_COOLDOWN = float(os.environ.get('YELP_BREAKER_COOLDOWN', 30)) # seconds to wait before trying Yelp again
+SLOW_CALL = float(os.environ.get('YELP_SLOW_CALL', 2)) # seconds, calls slower than this count as failures
+
+
+class YelpUnavailable(requests.RequestException):
+    """Raised instead of calling Yelp while the breaker is open or the quota is spent."""
+
+
+class CircuitBreaker:
+    """Stop calling Yelp for a while after repeated failures.
+
+    Closed: calls go through. After BREAKER_FAILURES consecutive failed or slow calls the breaker opens and calls are refused for BREAKER_COOLDOWN seconds. It then half-opens and lets a single trial call through; success closes it again, failure reopens it.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return whether a call to Yelp may be made now."""
+
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.trial_running = False
+
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, ok):
+        """Record the outcome of a call."""
+
+        with self._lock:
+            if ok:
+                self.state = "closed"
+                self.consecutive_failures = 0
+                self.trial_running = False
+                return
+
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failures:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+    def release(self):
+        """Give up a half-open trial call that was allowed but never made."""
+
+        with self._lock:
+            self.trial_running = False
+
+    def reset(self):
+        """Close the breaker and forget past failures."""
+
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def status(self):
+        """Return the breaker's state for operators."""
+
+        with self._lock:
+            retry_in = None
+            if self.state == "open":
+                retry_in = max(0, self.cooldown - (time.monotonic() - self.opened_at))
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in": retry_in
+            }
+
+
+breaker = CircuitBreaker()
+
+
+# The quota is a token bucket kept in a single row of the yelp_quota table, so every worker draws on the same budget.
+# Refilling and taking a token happen in one UPDATE, so concurrent workers can't spend the same token twice.
+REFILLED_TOKENS = "LEAST(:burst, tokens + EXTRACT(EPOCH FROM (now() - updated_at)) * :rate)"
+
+TAKE_TOKEN = text(f"""
+    UPDATE yelp_quota
+    SET tokens = {REFILLED_TOKENS} - 1, updated_at = now()
+    WHERE id = 1 AND {REFILLED_TOKENS} >= 1
+    RETURNING tokens""")
+
+CREATE_BUCKET = text("""
+    INSERT INTO yelp_quota (id, tokens, updated_at)
+    VALUES (1, :burst, now())
+    ON CONFLICT (id) DO NOTHING""")
+
+CHECK_TOKENS = text(f"SELECT {REFILLED_TOKENS} FROM yelp_quota WHERE id = 1")
+
+bucket = {"created": False}
+
+
+def take_quota():
+    """Spend one call from the shared Yelp quota. Return False if none are left."""
+
+    params = {"burst": QUOTA_BURST, "rate": QUOTA_RATE}
+    if not bucket["created"]:
+        with db.engine.begin() as conn:
+            conn.execute(CREATE_BUCKET, params)
+        bucket["created"] = True # only once committed, so no other thread tries to take from a bucket it can't see
+
+    with db.engine.begin() as conn:
+        return conn.execute(TAKE_TOKEN, params).first() is not None
+
+
+def quota_status():
+    """Return the remaining Yelp budget for operators."""
+
+    with db.engine.connect() as conn:
+        tokens = conn.execute(CHECK_TOKENS, {"burst": QUOTA_BURST, "rate": QUOTA_RATE}).scalar()
+
+    return {
+        "remaining": QUOTA_BURST if tokens is None else int(tokens),
+        "burst": QUOTA_BURST,
+        "daily_quota": DAILY_QUOTA
+    }
+
+
+def before_call():
+    """Raise YelpUnavailable unless a call to Yelp may be made now, spending quota if so."""
+
+    if not breaker.allow():
+        raise YelpUnavailable("Yelp circuit breaker is open.")
+    if not take_quota():
+        breaker.release()
+        raise YelpUnavailable("Yelp quota is used up.")
+
+
+def after_call(ok, seconds):
+    """Tell the breaker how a call to Yelp went."""
+
+    breaker.record(ok and seconds <= SLOW_CALL)
+
+
+def reset():
+    """Close the breaker and refill the quota."""
+
+    breaker.reset()
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM yelp_quota"))
+    bucket["created"] = False
@@ -0,0 +1,114 @@
+"""Local stand-in for the Yelp businesses API.
+
+Serves recorded /businesses/search and /businesses/<id> responses from a cassette file, so /search and /places can be load tested without a network connection or Yelp quota. Point the app at it with:
+
+    YELP_API_BASE_URL=http://localhost:5001/v3/businesses
+
+In record mode, requests missing from the cassette are forwarded to the real Yelp API and their responses saved.
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+from flask import Flask, jsonify, request
+
+YELP_API_BASE_URL = "https://api.yelp.com/v3/businesses"
+DEFAULT_CASSETTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "yelp_cassette.json")
+
+
+def cassette_key(term, location):
+    """Normalize a search the same way the app's search cache does"""
+
+    return f"{' '.join(term.lower().split())}|{' '.join(location.lower().split())}"
+
+
+def load_cassette(path):
+    """Read a cassette file, or start an empty one"""
+
+    if not os.path.exists(path):
+        return {"search": {}, "businesses": {}}
+    with open(path) as f:
+        cassette = json.load(f)
+    cassette.setdefault("search", {})
+    cassette.setdefault("businesses", {})
+    return cassette
+
+
+def create_app(cassette_path=DEFAULT_CASSETTE, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503, record=False, api_key=None, seed=None):
+    """Create the stand-in server.
+
+    Every response is delayed by latency_ms plus up to jitter_ms, and a random error_rate fraction of requests fail with error_status.
+    """
+
+    standin = Flask(__name__)
+    cassette = load_cassette(cassette_path)
+    lock = threading.Lock()
+    rng = random.Random(seed)
+
+    def save_cassette():
+        with open(cassette_path, "w") as f:
+            json.dump(cassette, f, indent=2)
+
+    def replay(section, key, path, params):
+        """Return the recorded response for key, recording it first if needed"""
+
+        with lock:
+            delay = (latency_ms + rng.uniform(0, jitter_ms)) / 1000
+            failed = rng.random() < error_rate
+        time.sleep(delay)
+
+        if failed:
+            return jsonify(error={"code": "INJECTED_ERROR", "description": "Error injected by the Yelp stand-in."}), error_status
+
+        if key not in cassette[section] and record:
+            res = requests.get(f"{YELP_API_BASE_URL}{path}", headers={'Authorization' : f'Bearer {api_key}'}, params=params, timeout=10)
+            if not res.ok:
+                return res.json(), res.status_code
+            with lock:
+                cassette[section][key] = res.json()
+                save_cassette()
+
+        if key not in cassette[section]:
+            if section == "search":
+                return jsonify(error={"code": "LOCATION_NOT_FOUND", "description": "No recorded search for this term and location."}), 400
+            return jsonify(error={"code": "BUSINESS_NOT_FOUND", "description": "The requested business could not be found."}), 404
+
+        return jsonify(cassette[section][key])
+
+    @standin.route("/v3/businesses/search")
+    def search():
+        term = request.args.get("term", "")
+        location = request.args.get("location", "")
+        return replay("search", cassette_key(term, location), "/search", {'term' : term, 'location' : location})
+
+    @standin.route("/v3/businesses/<business_id>")
+    def business(business_id):
+        return replay("businesses", business_id, f"/{business_id}", None)
+
+    return standin
+
+
+# Main code
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve recorded Yelp API responses.")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--record", action="store_true", help="forward unrecorded requests to Yelp using API_KEY and save them")
+    args = parser.parse_args()
+
+    load_dotenv() # API_KEY is only needed when recording
+
+    standin = create_app(cassette_path=args.cassette, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, error_status=args.error_status, record=args.record,
+        api_key=os.environ.get('API_KEY'), seed=args.seed)
+    standin.run(host='0.0.0.0', port=args.port, threaded=True)